@@ -0,0 +1,83 @@
+import argparse
+import os
+import subprocess
+import sys
+
+
+package_name = __package__.split('.')[0]
+package_parent = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+package_dir = os.path.join(package_parent, package_name)
+
+plotting_modules = ['results_plotter']
+
+
+def compute_modules():
+    # Every module of the package but the plotting ones, found on disk so
+    # a new module is checked without being listed here.
+    return sorted(
+        f[:-len('.py')] for f in os.listdir(package_dir)
+        if f.endswith('.py') and f != '__init__.py' and
+        f[:-len('.py')] not in plotting_modules
+    )
+
+
+# Run in a fresh interpreter per repeat, so every timing is a cold start.
+probe = '''
+import sys, time
+t = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - t
+print(elapsed, int('matplotlib' in sys.modules))
+'''
+
+
+def time_import(module, repeats):
+    timings = []
+    for _ in range(repeats):
+        out = subprocess.check_output(
+            [sys.executable, '-c', probe % module],
+            cwd=package_parent
+        )
+        elapsed, loads_matplotlib = out.split()
+        timings.append(float(elapsed))
+    return min(timings), bool(int(loads_matplotlib))
+
+
+def run(repeats):
+    # numpy and pandas are timed on their own as the floor every worker
+    # pays; results_plotter shows what each import cost before plotting
+    # was made lazy.
+    rows = [('numpy', ) + time_import('numpy', repeats)]
+    rows.append(('pandas', ) + time_import('pandas', repeats))
+    for m in compute_modules() + plotting_modules:
+        module = '%s.%s' % (package_name, m)
+        rows.append((module, ) + time_import(module, repeats))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Cold-start import time of the compute modules.'
+    )
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rows = run(args.repeats)
+    print('%-40s %10s  %s' % ('module', 'ms (best)', 'matplotlib'))
+    for module, elapsed, loads_matplotlib in rows:
+        print('%-40s %10.1f  %s' % (
+            module, elapsed * 1000, 'yes' if loads_matplotlib else 'no'
+        ))
+
+    headless = [r for r in rows if r[0].split('.')[-1] in compute_modules()]
+    if any(loads_matplotlib for _, _, loads_matplotlib in headless):
+        print('FAIL: a compute module imports matplotlib.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+
+package_name = __package__.split('.')[0]
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+
+default_output = os.path.join(benchmark_dir, 'results.json')
+default_baseline = os.path.join(benchmark_dir, 'baseline.json')
+
+project_categories = [
+    'Preliminaries', 'Site Works', 'Foundations', 'Framing', 'Roofing',
+    'Cladding', 'Services', 'Fit Out', 'Landscaping', 'Contingency'
+]
+
+
+def package_module(name):
+    return importlib.import_module('%s.%s' % (package_name, name))
+
+
+def quietly(fn):
+    # combine() and the summaries print; the benchmarks only time them.
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def collection_axes(n_scenarios, max_term):
+    # About n_scenarios scenarios over six axes, with loan terms spread up
+    # to max_term so the monthly series are max_term * 12 + 1 long.
+    side = max(int(round((n_scenarios / 8) ** 0.25)), 1)
+    return (
+        np.linspace(2e5, 6e5, side),
+        np.linspace(0.03, 0.09, side),
+        [False, True],
+        np.unique(np.linspace(max(max_term // 4, 1), max_term, 2).astype(int)),
+        [0, 1],
+        np.linspace(300, 900, side * side)
+    )
+
+
+def make_collection(n_scenarios, max_term):
+    testing = package_module('scenario_testing')
+    return testing.ScenarioCollection(
+        'benchmark', *collection_axes(n_scenarios, max_term), 52 * 0.5
+    )
+
+
+def combine_and_test_case(size):
+    n_scenarios, max_term = size
+    testing = package_module('scenario_testing')
+
+    def run():
+        collection = make_collection(n_scenarios, max_term)
+        testing.ScenarioTester('benchmark', collection.scenarios).test()
+    return quietly(run)
+
+
+def summarise_case(size):
+    n_scenarios, max_term = size
+    testing = package_module('scenario_testing')
+    collection = quietly(lambda: make_collection(n_scenarios, max_term))()
+    results = testing.GridScenarioTester('benchmark', collection.grid()).test()
+    return quietly(results.summarise)
+
+
+def write_project_csv(file_path, n_units, seed=0):
+    # Shaped like data-2016-05-16.csv: one project, units grouped into
+    # categories, and about a third of the amounts given as a range.
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    amount_min = np.round(rng.uniform(100, 50000, n_units), -1)
+    spread = np.where(rng.random(n_units) < 0.3, rng.uniform(1, 2, n_units), 1)
+    categories = np.sort(rng.integers(0, len(project_categories), n_units))
+    pd.DataFrame({
+        'id': ['%ia%i' % (c + 1, i) for i, c in enumerate(categories)],
+        'project': 'Benchmark Cabins',
+        'category': [project_categories[c] for c in categories],
+        'name': ['Item %i' % i for i in range(n_units)],
+        'description': '',
+        'amount_min': amount_min,
+        'amount_max': np.round(amount_min * spread, -1)
+    }).to_csv(file_path, index=False)
+
+
+def project_from_csv_case(size, directory):
+    analysis = package_module('project_analysis')
+    file_path = os.path.join(directory, 'project-%i.csv' % size)
+    write_project_csv(file_path, size)
+    return lambda: analysis.project_from_csv(file_path)
+
+
+def print_summary_case(size, directory):
+    analysis = package_module('project_analysis')
+    file_path = os.path.join(directory, 'project-%i.csv' % size)
+    write_project_csv(file_path, size)
+    project = analysis.project_from_csv(file_path)
+    return quietly(project.print_summary)
+
+
+def plot_case(size, directory):
+    import matplotlib
+    matplotlib.use('Agg')
+    plotter = package_module('results_plotter')
+    testing = package_module('scenario_testing')
+
+    collection = quietly(lambda: make_collection(size, 30))()
+    results = testing.GridScenarioTester('benchmark', collection.grid()).test()
+    file_name = os.path.join(directory, 'plot-%i.png' % size)
+    return lambda: plotter.ResultsPlotter(
+        'benchmark',
+        results.amount_repayed, results.amount_owing,
+        results.cumulative_revenue, results.cumulative_profit,
+        results.labels
+    ).plot_and_savefig(file_name)
+
+
+# (case name, set up function, sizes, quick sizes). A set up function
+# takes one size, plus a scratch directory if it asks for one, and
+# returns the callable that is measured.
+cases = [
+    ('combine_and_test', combine_and_test_case,
+     [(1000, 30), (10000, 30), (10000, 10), (10000, 50)],
+     [(1000, 10), (1000, 30)]),
+    ('summarise', summarise_case,
+     [(10000, 30), (100000, 30)],
+     [(10000, 30)]),
+    ('project_from_csv', project_from_csv_case,
+     [100, 10000, 100000],
+     [100, 10000]),
+    ('print_summary', print_summary_case,
+     [100, 10000, 100000],
+     [100, 10000]),
+    ('plot_and_savefig', plot_case,
+     [10, 100, 1000],
+     [10, 100])
+]
+
+
+# Shortest timing taken, in seconds. Fast cases are called in a loop until
+# one timing lasts this long, as timeit's autorange does, so millisecond
+# cases are not timed at the resolution of scheduler noise.
+min_timing = 0.2
+
+
+def calls_per_timing(fn):
+    calls = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        if time.perf_counter() - t >= min_timing:
+            return calls
+        calls *= 2
+
+
+def measure(fn, repeats):
+    # Best time per call over the repeats, then one more call under
+    # tracemalloc for the peak of memory allocated by Python and numpy.
+    calls = calls_per_timing(fn)
+    timings = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - t) / calls)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def case_key(name, size):
+    if isinstance(size, tuple):
+        size = 'x'.join(str(s) for s in size)
+    return '%s[%s]' % (name, size)
+
+
+def run(repeats, quick=False, pattern=None):
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, set_up, sizes, quick_sizes in cases:
+            if pattern and pattern not in name:
+                continue
+            for size in quick_sizes if quick else sizes:
+                if set_up.__code__.co_argcount > 1:
+                    fn = set_up(size, directory)
+                else:
+                    fn = set_up(size)
+                seconds, peak = measure(fn, repeats)
+                records.append({
+                    'case': case_key(name, size),
+                    'seconds': seconds,
+                    'peak_bytes': peak
+                })
+                print('%-36s %10.1f ms %10.1f MB' % (
+                    records[-1]['case'], seconds * 1000, peak / 2 ** 20
+                ))
+    return records
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'system': platform.system()
+    }
+
+
+def compare(records, baseline, tolerance, noise_floor):
+    # A case regresses when its time or peak memory is more than tolerance
+    # (a fraction) above the baseline. Time must also have grown by more
+    # than noise_floor seconds, as small cases jitter by more than any
+    # useful tolerance; peak memory is deterministic and has no floor.
+    # Cases missing from either side are skipped here and reported by
+    # missing_cases.
+    previous = {r['case']: r for r in baseline['records']}
+    regressions = []
+    for r in records:
+        old = previous.get(r['case'])
+        if old is None:
+            continue
+        for k in ('seconds', 'peak_bytes'):
+            if k == 'seconds' and r[k] - old[k] <= noise_floor:
+                continue
+            if r[k] > old[k] * (1 + tolerance):
+                regressions.append((r['case'], k, old[k], r[k]))
+    return regressions
+
+
+def missing_cases(records, baseline):
+    previous = set(r['case'] for r in baseline['records'])
+    return [r['case'] for r in records if r['case'] not in previous]
+
+
+def merge_records(old, new):
+    # old with the cases measured again replaced by their new records.
+    replaced = set(r['case'] for r in new)
+    return [r for r in old if r['case'] not in replaced] + new
+
+
+def read_json(file_path):
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def write_json(file_path, records):
+    with open(file_path, 'w') as f:
+        json.dump(
+            {'environment': environment(), 'records': records}, f, indent=2
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time and peak memory of the scenario, project and '
+                    'plotting hot paths.'
+    )
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--quick', action='store_true',
+                        help='only the smaller sizes of each case')
+    parser.add_argument('--filter', default=None,
+                        help='only cases whose name contains this')
+    parser.add_argument('--output', default=default_output)
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='merge this run into the baseline')
+    parser.add_argument('--require-baseline', action='store_true',
+                        help='fail when the baseline is missing or lacks '
+                             'a case, as in CI')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--noise-floor', type=float, default=0.002,
+                        help='seconds a time must grow by to count')
+    args = parser.parse_args(argv)
+
+    records = run(args.repeats, args.quick, args.filter)
+    write_json(args.output, records)
+
+    if args.update_baseline:
+        # Merged, so full and --quick runs can share one baseline.
+        if os.path.exists(args.baseline):
+            records = merge_records(read_json(args.baseline)['records'],
+                                    records)
+        write_json(args.baseline, records)
+        print('Baseline written to %s.' % args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('WARNING: no baseline at %s, nothing compared.' % args.baseline)
+        return 2 if args.require_baseline else 0
+
+    baseline = read_json(args.baseline)
+    if baseline.get('environment') != environment():
+        print('WARNING: the baseline was measured on %s; timings may not '
+              'compare.' % baseline.get('environment'))
+    unmatched = missing_cases(records, baseline)
+    for case in unmatched:
+        print('WARNING: %s is not in the baseline.' % case)
+    regressions = compare(records, baseline, args.tolerance, args.noise_floor)
+    for case, k, old, new in regressions:
+        print('REGRESSION: %s %s %.4g -> %.4g (%+.0f%%)'
+              % (case, k, old, new, (new / old - 1) * 100))
+    if regressions:
+        return 1
+    return 2 if unmatched and args.require_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# The active Recorder, or None while instrumentation is off. stage() then
+# hands back one shared do-nothing stage, so instrumented code pays for a
+# global lookup and an empty with block.
+recorder = None
+
+
+class NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def arrays(self, **arrays):
+        pass
+
+    def info(self, **info):
+        pass
+
+
+null_stage = NullStage()
+
+
+def stage(name, **info):
+    if recorder is None:
+        return null_stage
+    return Stage(recorder, name, info)
+
+
+def run_stage(name, fn, *args):
+    # fn(*args) as one stage, recording the shape and size of its result.
+    with stage(name) as s:
+        result = fn(*args)
+        s.arrays(result=result)
+    return result
+
+
+def enable(trace_memory=True):
+    # Starts recording stages. With trace_memory, tracemalloc runs too and
+    # every stage gets the peak memory allocated while it ran; this slows
+    # allocation-heavy code, so leave it off for timing alone.
+    global recorder
+    recorder = Recorder(trace_memory)
+    return recorder
+
+
+def disable():
+    global recorder
+    active, recorder = recorder, None
+    if active is not None:
+        active.stop()
+    return active
+
+
+@contextmanager
+def recording(trace_memory=True):
+    active = enable(trace_memory)
+    try:
+        yield active
+    finally:
+        disable()
+
+
+class Recorder(object):
+    def __init__(self, trace_memory=True):
+        self.records = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.open_stages = {}
+        self.overlaps = 0
+        self.trace_memory = trace_memory
+        self.started_tracemalloc = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+
+    def stop(self):
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def open_stage(self):
+        # tracemalloc's peak is process-wide but stage stacks are per
+        # thread, so peaks are only kept for stages that ran while no other
+        # thread had a stage open. overlaps counts the stages entered while
+        # another thread was recording; a stage whose count changed before
+        # it exited has a peak that may be another thread's, or was reset
+        # by one. Returns the count and whether this thread is alone.
+        thread = threading.get_ident()
+        with self.lock:
+            self.open_stages[thread] = self.open_stages.get(thread, 0) + 1
+            if len(self.open_stages) > 1:
+                self.overlaps += 1
+            return self.overlaps, len(self.open_stages) == 1
+
+    def close_stage(self):
+        thread = threading.get_ident()
+        with self.lock:
+            self.open_stages[thread] -= 1
+            if self.open_stages[thread] == 0:
+                del self.open_stages[thread]
+            return self.overlaps
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def to_json(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.records, f, indent=2)
+
+    def chrome_trace(self):
+        # Complete ('X') events in microseconds, which chrome://tracing and
+        # Perfetto lay out as nested bars per thread.
+        return {
+            'traceEvents': [
+                {
+                    'name': r['name'],
+                    'ph': 'X',
+                    'ts': r['start'] * 1e6,
+                    'dur': r['wall'] * 1e6,
+                    'pid': self.pid,
+                    'tid': r['thread'],
+                    'args': {
+                        k: v for k, v in r.items()
+                        if k not in ('name', 'start', 'wall', 'thread')
+                    }
+                }
+                for r in self.records
+            ],
+            'displayTimeUnit': 'ms'
+        }
+
+    def to_chrome_trace(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def totals(self):
+        # {stage name: (calls, wall, cpu)} summed over the records.
+        totals = {}
+        for r in self.records:
+            calls, wall, cpu = totals.get(r['name'], (0, 0.0, 0.0))
+            totals[r['name']] = (calls + 1, wall + r['wall'], cpu + r['cpu'])
+        return totals
+
+
+class Stage(object):
+    # One timed region. Peak memory is tracemalloc's peak while the stage
+    # ran, above what was allocated when it started; nested stages pass
+    # their peaks up so resetting the peak for a child loses nothing.
+    # Stages that overlap another thread's stages get no peak_bytes, see
+    # Recorder.open_stage.
+    def __init__(self, recorder, name, info):
+        self.recorder = recorder
+        self.record = {'name': name}
+        self.record.update(info)
+        self.peak = 0
+
+    def __enter__(self):
+        stack = self.recorder.stack()
+        self.record['depth'] = len(stack)
+        self.record['thread'] = threading.get_ident()
+        self.overlaps, alone = self.recorder.open_stage()
+        if alone and self.recorder.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        else:
+            self.memory_start = None
+        stack.append(self)
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        stack = self.recorder.stack()
+        stack.pop()
+        alone = self.recorder.close_stage() == self.overlaps
+
+        self.record['start'] = self.wall_start - self.recorder.origin
+        self.record['wall'] = wall_end - self.wall_start
+        self.record['cpu'] = cpu_end - self.cpu_start
+        if alone and self.memory_start is not None and \
+                tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(self.peak, peak)
+            self.record['peak_bytes'] = peak - self.memory_start
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if exc[0] is not None:
+            self.record['error'] = exc[0].__name__
+        self.recorder.add(self.record)
+        return False
+
+    def arrays(self, **arrays):
+        # Shape, dtype and size of arrays the stage produced.
+        described = self.record.setdefault('arrays', {})
+        for k, X in arrays.items():
+            described[k] = {
+                'shape': list(getattr(X, 'shape', (len(X), ))),
+                'dtype': str(getattr(X, 'dtype', 'object')),
+                'nbytes': int(getattr(X, 'nbytes', 0))
+            }
+
+    def info(self, **info):
+        self.record.update(info)
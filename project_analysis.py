@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import math
 
+from .instrumentation import stage
+
 
 class ProjectVariable(object):
     def is_str(self, variable_name, x):
@@ -95,44 +97,298 @@ class ProjectUnit(ProjectVariable):
         return np.array((min, max))
 
 
+class ProjectColumns(ProjectVariable):
+    # Column-oriented storage for a project's units: one array per field and
+    # validation that runs over whole columns, reporting every bad row.
+    # The columns are copies owned by the project, as edit_unit writes to
+    # them in place; views of a DataFrame or of another store's arrays,
+    # such as ProjectRevisions', are never edited through it.
+    def __init__(self, ids, projects, categories, names,
+                 descriptions, amount_min, amount_max):
+        self.ids = np.array(ids, dtype=object)
+        self.projects = np.array(projects, dtype=object)
+        self.categories = np.array(categories, dtype=object)
+        self.names = np.array(names, dtype=object)
+        self.descriptions = self.process_nans(
+            np.array(descriptions, dtype=object)
+        )
+        self.amount_min = np.array(amount_min)
+        self.amount_max = np.array(amount_max)
+
+        self.validate_self()
+
+    @classmethod
+    def from_units(cls, units):
+        return cls(
+            [u.id for u in units],
+            [u.project for u in units],
+            [u.category for u in units],
+            [u.name for u in units],
+            [u.description for u in units],
+            np.array([u.amount[0] for u in units], dtype='float64'),
+            np.array([u.amount[1] for u in units], dtype='float64')
+        )
+
+    @classmethod
+    def from_frame(cls, data):
+        # Columns are taken by position, as unit_from_row does.
+        columns = [data.iloc[:, i] for i in range(data.shape[1])]
+        return cls(*(
+            [c.to_numpy(dtype=object) for c in columns[:5]] +
+            [c.to_numpy() for c in columns[5:]]
+        ))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def unit(self, i):
+        return ProjectUnit(
+            self.ids[i], self.projects[i], self.categories[i], self.names[i],
+            self.descriptions[i], self.amount_min[i], self.amount_max[i]
+        )
+
+    def summary_str(self, i):
+        return ', '.join([
+            self.ids[i], self.names[i],
+            formated_amount((self.amount_min[i], self.amount_max[i]))
+        ])
+
+    def append(self, unit):
+        self.ids = np.append(self.ids, np.array([unit.id], dtype=object))
+        self.projects = np.append(
+            self.projects, np.array([unit.project], dtype=object)
+        )
+        self.categories = np.append(
+            self.categories, np.array([unit.category], dtype=object)
+        )
+        self.names = np.append(self.names, np.array([unit.name], dtype=object))
+        self.descriptions = np.append(
+            self.descriptions, np.array([unit.description], dtype=object)
+        )
+        self.amount_min = np.append(self.amount_min, unit.amount[0])
+        self.amount_max = np.append(self.amount_max, unit.amount[1])
+        return len(self.ids) - 1
+
+    def delete(self, i):
+        self.ids = np.delete(self.ids, i)
+        self.projects = np.delete(self.projects, i)
+        self.categories = np.delete(self.categories, i)
+        self.names = np.delete(self.names, i)
+        self.descriptions = np.delete(self.descriptions, i)
+        self.amount_min = np.delete(self.amount_min, i)
+        self.amount_max = np.delete(self.amount_max, i)
+
+    def set_row(self, i, unit):
+        self.ids[i] = unit.id
+        self.projects[i] = unit.project
+        self.categories[i] = unit.category
+        self.names[i] = unit.name
+        self.descriptions[i] = unit.description
+        self.amount_min[i] = unit.amount[0]
+        self.amount_max[i] = unit.amount[1]
+
+    def process_nans(self, x):
+        return np.where(pd.isna(x), None, x)
+
+    def validate_self(self):
+        self.columns_are_correct_len()
+
+        type_errors = (
+            self.bad_str_rows('id', self.ids) +
+            self.bad_str_rows('project', self.projects) +
+            self.bad_str_rows('category', self.categories) +
+            self.bad_str_rows('name', self.names) +
+            self.bad_str_rows('description', self.descriptions, optional=True) +
+            self.bad_float64_column('amount_min', self.amount_min) +
+            self.bad_float64_column('amount_max', self.amount_max)
+        )
+        if type_errors:
+            raise TypeError('\n'.join(type_errors))
+
+        order_errors = self.badly_ordered_rows()
+        if order_errors:
+            raise RuntimeError('\n'.join(order_errors))
+
+    def columns_are_correct_len(self):
+        lengths = [
+            len(x) for x in (
+                self.ids, self.projects, self.categories, self.names,
+                self.descriptions, self.amount_min, self.amount_max
+            )
+        ]
+        if len(set(lengths)) != 1:
+            raise RuntimeError(
+                'Project columns have different lengths: %s' % str(lengths)
+            )
+
+    def bad_str_rows(self, variable_name, x, optional=False):
+        # infer_dtype settles the common all-valid case in one pass; only a
+        # failing column is checked row by row to name the bad rows.
+        if pd.api.types.infer_dtype(x, skipna=optional) in ('string', 'empty'):
+            return []
+        return [
+            'Row %i: %s (%s, %s) is not a str.'
+            % (i, variable_name, str(v), type(v))
+            for i, v in enumerate(x)
+            if not (isinstance(v, str) or (optional and v is None))
+        ]
+
+    def bad_float64_column(self, variable_name, x):
+        if np.issubdtype(x.dtype, np.float64):
+            return []
+        return ['%s column (%s) is not a float64.' % (variable_name, x.dtype)]
+
+    def badly_ordered_rows(self):
+        bad = np.flatnonzero(~(self.amount_min <= self.amount_max))
+        return [
+            'Row %i: amount is not ordered [min, max], amount = %s'
+            % (i, str(np.array((self.amount_min[i], self.amount_max[i]))))
+            for i in bad
+        ]
+
+
 class Project(object):
-    def __init__(self, units):
-        self.units = units
+    def __init__(self, units=None, columns=None):
+        if columns is None:
+            columns = ProjectColumns.from_units(units)
+        self.columns = columns
+        self._units = units
         self.name = self.project_name_set().pop()
-        self.categories = self.categories_set()
 
         self.validate_self()
+        self.build_category_index()
+
+    @property
+    def units(self):
+        if self._units is None:
+            self._units = [self.columns.unit(i) for i in range(len(self.columns))]
+        return self._units
+
+    def build_category_index(self):
+        # Rows and [min, max] subtotals per category, kept up to date by
+        # add_unit, remove_unit and edit_unit instead of being rescanned.
+        codes, categories = pd.factorize(self.columns.categories)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=len(categories)))
+        rows = np.split(order, bounds[:-1])
+
+        n = len(categories)
+        mins = np.bincount(codes, weights=self.columns.amount_min, minlength=n)
+        maxs = np.bincount(codes, weights=self.columns.amount_max, minlength=n)
+
+        self.categories = list(categories)
+        self.category_index = dict(zip(self.categories, rows))
+        self.subtotals = {
+            cat: np.array((mins[k], maxs[k]))
+            for k, cat in enumerate(self.categories)
+        }
+        self.grand_total = self.calc_rows_total(slice(None))
 
     def print_summary(self):
         print('Project summary - %s:' % self.name)
         for cat in self.categories:
             print('  Category summary - %s' % cat)
-            units_in_cat = self.in_category(cat)
-            for u in units_in_cat:
-                print('    - %s' % u.summary_str())
+            for i in self.category_rows(cat):
+                print('    - %s' % self.columns.summary_str(i))
             print('    Subtotal: %s'
                   % formated_amount(self.category_total(cat)))
         print('Total: %s' % formated_amount(self.total()))
 
     def in_category(self, category):
-        return [u for u in self.units if u.category == category]
+        units = self.units
+        return [units[i] for i in self.category_rows(category)]
+
+    def category_rows(self, category):
+        return self.category_index.get(category, np.array([], dtype='int64'))
 
     def total(self):
-        return self.calc_total(self.units)
+        return self.grand_total.copy()
 
     def category_total(self, category):
-        units_in_cat = self.in_category(category)
-        return self.calc_total(units_in_cat)
+        if category not in self.subtotals:
+            return np.zeros(2)
+        return self.subtotals[category].copy()
+
+    def add_unit(self, unit):
+        self.unit_is_in_project(unit)
+        i = self.columns.append(unit)
+        self.index_row(i, unit.category, unit.amount)
+        self._units = None
+        return i
+
+    def remove_unit(self, i):
+        # A negative i counts from the end, as for a list; the index is
+        # kept in row numbers, so it is made non-negative first.
+        i = range(len(self.columns))[i]
+        category = self.columns.categories[i]
+        self.unindex_row(i, category, self.row_amount(i))
+        self.columns.delete(i)
+        for cat, rows in self.category_index.items():
+            rows[rows > i] -= 1
+        self._units = None
+
+    def edit_unit(self, i, **changes):
+        # changes may set any ProjectUnit field, e.g. amount_min=1000.0.
+        i = range(len(self.columns))[i]
+        fields = {
+            'id': self.columns.ids[i],
+            'project': self.columns.projects[i],
+            'category': self.columns.categories[i],
+            'name': self.columns.names[i],
+            'description': self.columns.descriptions[i],
+            'amount_min': self.columns.amount_min[i],
+            'amount_max': self.columns.amount_max[i]
+        }
+        fields.update(changes)
+        unit = ProjectUnit(**fields)
+        self.unit_is_in_project(unit)
+
+        self.unindex_row(i, self.columns.categories[i], self.row_amount(i))
+        self.columns.set_row(i, unit)
+        self.index_row(i, unit.category, unit.amount)
+        self._units = None
+
+    def index_row(self, i, category, amount):
+        if category not in self.category_index:
+            self.categories.append(category)
+            self.category_index[category] = np.array([], dtype='int64')
+            self.subtotals[category] = np.zeros(2)
+        rows = self.category_index[category]
+        self.category_index[category] = np.insert(
+            rows, np.searchsorted(rows, i), i
+        )
+        self.subtotals[category] += amount
+        self.grand_total += amount
+
+    def unindex_row(self, i, category, amount):
+        rows = self.category_index[category]
+        rows = rows[rows != i]
+        self.subtotals[category] -= amount
+        self.grand_total -= amount
+        if len(rows) == 0:
+            self.categories.remove(category)
+            del self.category_index[category]
+            del self.subtotals[category]
+        else:
+            self.category_index[category] = rows
 
-    def calc_total(self, sub_units):
-        t = sum([u.amount for u in sub_units])
-        return t
+    def row_amount(self, i):
+        return np.array((self.columns.amount_min[i], self.columns.amount_max[i]))
 
-    def project_name_set(self):
-        return unique([u.project for u in self.units])
+    def unit_is_in_project(self, unit):
+        if unit.project != self.name:
+            raise RuntimeError(
+                'Uncertain project name: %s' % str([self.name, unit.project])
+            )
 
-    def categories_set(self):
-        return unique([u.category for u in self.units])
+    def calc_rows_total(self, rows):
+        return np.array((
+            self.columns.amount_min[rows].sum(),
+            self.columns.amount_max[rows].sum()
+        ))
+
+    def project_name_set(self):
+        return list(pd.unique(self.columns.projects))
 
     def validate_self(self):
         names = self.project_name_set()
@@ -144,16 +400,14 @@ def formated_amount(t):
     return '${0:,.1f} - ${1:,.1f}'.format(*t)
 
 
-def unique(seq):
-    seen = set()
-    unique = [x for x in seq if not (x in seen or seen.add(x))]
-    return unique
-
-
 def project_from_csv(file_path):
-    data = pd.read_csv(file_path)
-    units = [unit_from_row(r) for _, r in data.iterrows()]
-    project = Project(units)
+    with stage('project_from_csv.read_csv', file_path=file_path) as s:
+        data = pd.read_csv(file_path)
+        s.info(n_rows=len(data))
+    with stage('project_from_csv.columns'):
+        columns = ProjectColumns.from_frame(data)
+    with stage('project_from_csv.index'):
+        project = Project(columns=columns)
     return project
 
 
@@ -0,0 +1,139 @@
+import numpy as np
+
+from .scenario_grid import ScenarioGrid
+from .scenario_testing import (
+    GridScenarioTester, ScenarioCollection, ScenarioSummary
+)
+
+
+class ProjectFinancing(object):
+    # Financing scenarios for a batch of projects, with each project's cost
+    # as its principle axis and the other axes shared, as in
+    # ScenarioCollection. A Project's axis spans its [min, max] total in
+    # n_principles steps; a ProjectSimulationResults' axis is its total
+    # cost percentiles. Every project is evaluated in one grid.
+    def __init__(self,
+                 name,
+                 annual_interest_rates, interest_only,
+                 loan_terms_in_years, lead_times_in_years,
+                 revenue_units, annual_revenue_factor,
+                 n_principles=5, percentiles=(5, 25, 50, 75, 95)):
+        self.name = name
+        self.annual_interest_rates = annual_interest_rates
+        self.interest_only = interest_only
+        self.loan_terms_in_years = loan_terms_in_years
+        self.lead_times_in_years = lead_times_in_years
+        self.revenue_units = revenue_units
+        self.annual_revenue_factor = annual_revenue_factor
+        self.n_principles = n_principles
+        self.percentiles = percentiles
+
+    def principles(self, source):
+        if hasattr(source, 'total_percentiles'):
+            return np.unique(source.total_percentiles(self.percentiles))
+        lo, hi = source.total()
+        return np.unique(np.linspace(lo, hi, self.n_principles))
+
+    def collection(self, source):
+        return ScenarioCollection(
+            source.name,
+            self.principles(source),
+            self.annual_interest_rates,
+            self.interest_only,
+            self.loan_terms_in_years,
+            self.lead_times_in_years,
+            self.revenue_units,
+            self.annual_revenue_factor,
+            build_scenarios=False
+        )
+
+    def grid(self, sources):
+        # The batch grid and the row offsets of each project in it.
+        grids = [self.collection(s).grid() for s in sources]
+        offsets = np.concatenate((
+            [0], np.cumsum([g.num_scenarios() for g in grids])
+        ))
+        return ScenarioGrid.concatenate(self.name, grids), offsets
+
+    def evaluate(self, sources):
+        # sources is a Project or ProjectSimulationResults, or a list of
+        # them. Results are looked up by project name, so names must be
+        # unique; a Project and its ProjectSimulationResults share one.
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+        names = [s.name for s in sources]
+        duplicates = sorted({n for n in names if names.count(n) > 1})
+        if duplicates:
+            raise ValueError(
+                'Project names must be unique; rename the repeats of %s.'
+                % ', '.join(duplicates)
+            )
+        grid, offsets = self.grid(sources)
+        return FinancingResults(self.name, names, grid, offsets)
+
+
+class FinancingResults(object):
+    # Closed-form summary figures of the batch grid, reduced per project
+    # with reduceat over the project row offsets. Monthly results are
+    # only built when asked for, one project at a time.
+    def __init__(self, name, project_names, grid, offsets):
+        self.name = name
+        self.project_names = project_names
+        self.grid = grid
+        self.offsets = offsets
+        self.project_index = np.repeat(
+            np.arange(len(project_names)), np.diff(offsets)
+        )
+        self.figures = grid.summary_figures()
+
+    def __len__(self):
+        return len(self.project_names)
+
+    def ranges(self):
+        # {figure: (mins, maxs)} with one value per project.
+        starts = self.offsets[:-1]
+        return {
+            k: (np.minimum.reduceat(X, starts), np.maximum.reduceat(X, starts))
+            for k, X in self.figures.items()
+        }
+
+    def best_and_worst_index(self):
+        # Batch rows of each project's highest and lowest total profit.
+        order = np.lexsort((self.figures['total_profit'], self.project_index))
+        return order[self.offsets[1:] - 1], order[self.offsets[:-1]]
+
+    def summaries(self):
+        ranges = self.ranges()
+        best, worst = self.best_and_worst_index()
+        labels = self.grid.labels()
+        return [
+            ScenarioSummary(
+                project_name,
+                {k: (lo[j], hi[j]) for k, (lo, hi) in ranges.items()},
+                labels[best[j]], labels[worst[j]]
+            )
+            for j, project_name in enumerate(self.project_names)
+        ]
+
+    def summary(self, project):
+        return self.summaries()[self.project_position(project)]
+
+    def summarise(self):
+        for summary in self.summaries():
+            summary.summarise()
+
+    def project_position(self, project):
+        if isinstance(project, str):
+            return self.project_names.index(project)
+        return project
+
+    def project_grid(self, project):
+        j = self.project_position(project)
+        return self.grid.chunk(self.offsets[j], self.offsets[j + 1])
+
+    def results(self, project):
+        # Monthly ScenarioTestResults of one project's scenarios.
+        j = self.project_position(project)
+        return GridScenarioTester(
+            self.project_names[j], self.project_grid(j)
+        ).test()
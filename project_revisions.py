@@ -0,0 +1,224 @@
+import glob
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .project_analysis import Project, ProjectColumns
+
+
+parse_cache_format_version = 1
+
+str_columns = ['ids', 'projects', 'categories', 'names']
+
+
+class ProjectParseCache(object):
+    # Parsed project CSVs as uncompressed .npz files of fixed width
+    # columns, one per source file. An entry is only used while the
+    # source's size and modification time match those stored with it, so
+    # a changed file is parsed again and its entry rewritten.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, file_path):
+        key = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+        return os.path.join(self.directory, key + '.npz')
+
+    def source_stamp(self, file_path):
+        stat = os.stat(file_path)
+        return np.array(
+            [parse_cache_format_version, stat.st_size, stat.st_mtime_ns],
+            dtype='int64'
+        )
+
+    def read(self, file_path):
+        path = self.entry_path(file_path)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as entry:
+            if not np.array_equal(entry['stamp'], self.source_stamp(file_path)):
+                return None
+            descriptions = np.where(
+                entry['has_description'],
+                entry['descriptions'].astype(object), None
+            )
+            return ProjectColumns(
+                *[entry[k].astype(object) for k in str_columns],
+                descriptions,
+                entry['amount_min'], entry['amount_max']
+            )
+
+    def write(self, file_path, columns, stamp):
+        # Written under a temporary name and renamed, so a reader in
+        # another thread or process never sees half an entry.
+        path = self.entry_path(file_path)
+        has_description = ~pd.isna(columns.descriptions)
+        temporary = '%s.%i.tmp' % (path, os.getpid())
+        with open(temporary, 'wb') as f:
+            np.savez(
+                f,
+                stamp=stamp,
+                descriptions=np.where(
+                    has_description, columns.descriptions, ''
+                ).astype(str),
+                has_description=has_description,
+                amount_min=columns.amount_min,
+                amount_max=columns.amount_max,
+                **{k: getattr(columns, k).astype(str) for k in str_columns}
+            )
+        os.replace(temporary, path)
+
+    def load(self, file_path):
+        # The stamp is taken before parsing, so a file changed mid-parse
+        # leaves a stale stamp and is parsed again next time.
+        columns = self.read(file_path)
+        if columns is None:
+            stamp = self.source_stamp(file_path)
+            columns = parse_project_columns(file_path)
+            self.write(file_path, columns, stamp)
+        return columns
+
+
+class ProjectRevisions(object):
+    # Dated snapshots of one project's estimate, stacked into one set of
+    # columns with a revision number per row. Revisions are in file name
+    # order, which is date order for names like data-2016-05-16.csv.
+    def __init__(self, names, columns, offsets):
+        self.names = names
+        self.columns = columns
+        self.offsets = offsets
+        self.revision = np.repeat(np.arange(len(names)), np.diff(offsets))
+        self.category_codes, categories = pd.factorize(columns.categories)
+        self.categories = list(categories)
+
+    @classmethod
+    def from_columns(cls, names, revisions):
+        offsets = np.concatenate(([0], np.cumsum([len(c) for c in revisions])))
+        columns = ProjectColumns(*[
+            np.concatenate([getattr(c, k) for c in revisions])
+            for k in (
+                'ids', 'projects', 'categories', 'names',
+                'descriptions', 'amount_min', 'amount_max'
+            )
+        ])
+        return cls(names, columns, offsets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def revision_index(self, revision):
+        if isinstance(revision, str):
+            return self.names.index(revision)
+        return revision
+
+    def rows(self, revision):
+        i = self.revision_index(revision)
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def project(self, revision):
+        rows = self.rows(revision)
+        c = self.columns
+        return Project(columns=ProjectColumns(
+            c.ids[rows], c.projects[rows], c.categories[rows], c.names[rows],
+            c.descriptions[rows], c.amount_min[rows], c.amount_max[rows]
+        ))
+
+    def totals(self):
+        # (revisions, 2) array of [min, max] project totals.
+        n = len(self)
+        return np.stack([
+            np.bincount(self.revision, weights=self.columns.amount_min,
+                        minlength=n),
+            np.bincount(self.revision, weights=self.columns.amount_max,
+                        minlength=n)
+        ], axis=1)
+
+    def category_totals(self):
+        # (revisions, categories, 2) array of [min, max] subtotals, in the
+        # order of self.categories; a category missing from a revision
+        # totals zero there.
+        n, k = len(self), len(self.categories)
+        cell = self.revision * k + self.category_codes
+        return np.stack([
+            np.bincount(cell, weights=self.columns.amount_min,
+                        minlength=n * k).reshape(n, k),
+            np.bincount(cell, weights=self.columns.amount_max,
+                        minlength=n * k).reshape(n, k)
+        ], axis=2)
+
+    def unit_frame(self, revision):
+        rows = self.rows(revision)
+        c = self.columns
+        return pd.DataFrame({
+            'category': c.categories[rows],
+            'id': c.ids[rows],
+            'name': c.names[rows],
+            'amount_min': c.amount_min[rows],
+            'amount_max': c.amount_max[rows]
+        })
+
+    def unit_diff(self, old, new, changed_only=True):
+        # Units matched by category and id between two revisions (ids repeat
+        # across categories, as in the per-cabin categories), with their
+        # amounts in each and the change. status is added, removed,
+        # changed or same.
+        diff = pd.merge(
+            self.unit_frame(old), self.unit_frame(new),
+            on=['category', 'id'], how='outer', suffixes=('_old', '_new'),
+            indicator=True
+        )
+        for k in ('amount_min', 'amount_max'):
+            diff['%s_change' % k] = \
+                diff['%s_new' % k].fillna(0) - diff['%s_old' % k].fillna(0)
+        moved = (diff['amount_min_change'] != 0) | \
+            (diff['amount_max_change'] != 0) | \
+            (diff['name_old'] != diff['name_new'])
+        diff['status'] = np.select(
+            [diff['_merge'] == 'right_only', diff['_merge'] == 'left_only',
+             moved],
+            ['added', 'removed', 'changed'],
+            'same'
+        )
+        diff = diff.drop(columns='_merge')
+        if changed_only:
+            diff = diff[diff['status'] != 'same'].reset_index(drop=True)
+        return diff
+
+    def category_diff(self, old, new):
+        totals = self.category_totals()
+        a = totals[self.revision_index(old)]
+        b = totals[self.revision_index(new)]
+        return pd.DataFrame({
+            'category': self.categories,
+            'amount_min_old': a[:, 0],
+            'amount_max_old': a[:, 1],
+            'amount_min_new': b[:, 0],
+            'amount_max_new': b[:, 1],
+            'amount_min_change': b[:, 0] - a[:, 0],
+            'amount_max_change': b[:, 1] - a[:, 1]
+        })
+
+
+def parse_project_columns(file_path):
+    return ProjectColumns.from_frame(pd.read_csv(file_path))
+
+
+def load_revisions(directory, pattern='*.csv', cache_directory=None,
+                   max_workers=None):
+    # Parses every matching CSV in directory on a thread pool. With a cache
+    # directory, only files that are new or changed since the last run are
+    # parsed; the rest are read back from the cache.
+    file_paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    if cache_directory is not None:
+        load = ProjectParseCache(cache_directory).load
+    else:
+        load = parse_project_columns
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        revisions = list(pool.map(load, file_paths))
+
+    names = [os.path.splitext(os.path.basename(p))[0] for p in file_paths]
+    return ProjectRevisions.from_columns(names, revisions)
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from .streaming_stats import StreamingHistogram
+
+
+def uniform_fractions(rng, mode, size):
+    return rng.random(size)
+
+
+def triangular_fractions(rng, mode, size):
+    # Inverse CDF of the triangular distribution on [0, 1] peaking at mode;
+    # unlike Generator.triangular it accepts zero-width ranges.
+    u = rng.random(size)
+    c = np.broadcast_to(mode, size)
+    return np.where(
+        u < c,
+        np.sqrt(u * c),
+        1 - np.sqrt((1 - u) * (1 - c))
+    )
+
+
+def pert_fractions(rng, mode, size):
+    alpha = 1 + 4 * np.asarray(mode, dtype='float64')
+    beta = 1 + 4 * (1 - np.asarray(mode, dtype='float64'))
+    return rng.beta(
+        np.broadcast_to(alpha, size), np.broadcast_to(beta, size)
+    )
+
+
+distributions = {
+    'uniform': uniform_fractions,
+    'triangular': triangular_fractions,
+    'pert': pert_fractions
+}
+
+# Draw-sized arrays alive at once while a chunk is drawn and costed, with
+# triangular_fractions' temporaries the most.
+chunk_working_arrays = 6
+
+
+class ProjectSimulator(object):
+    # Monte Carlo draws of every unit's cost within [amount_min, amount_max],
+    # summed into project and category totals a chunk of draws at a time.
+    # A chunk holds as many draws as fit in max_chunk_bytes, so large cost
+    # sheets take fewer draws per chunk rather than more memory.
+    # mode is where the most likely cost sits in each range, as a fraction
+    # of the range (scalar or one per unit); uniform draws ignore it.
+    def __init__(self, project,
+                 distribution='uniform', mode=0.5,
+                 seed=None, max_chunk_bytes=256 * 1024 ** 2, bins=4096):
+        if distribution not in distributions:
+            raise ValueError(
+                'Unknown distribution %s, expected one of %s.'
+                % (distribution, ', '.join(sorted(distributions)))
+            )
+        self.project = project
+        self.distribution = distribution
+        self.mode = mode
+        self.seed = seed
+        self.max_chunk_bytes = max_chunk_bytes
+        self.bins = bins
+
+        columns = project.columns
+        self.amount_min = columns.amount_min.astype('float64')
+        self.amount_max = columns.amount_max.astype('float64')
+        self.categories = list(project.categories)
+        codes = pd.Index(self.categories).get_indexer(columns.categories)
+        self.category_matrix = np.zeros((len(codes), len(self.categories)))
+        self.category_matrix[np.arange(len(codes)), codes] = 1
+
+    def draws_per_chunk(self):
+        draw_bytes = chunk_working_arrays * 8 * max(len(self.amount_min), 1)
+        return max(1, self.max_chunk_bytes // draw_bytes)
+
+    def simulate(self, n_draws):
+        rng = np.random.default_rng(self.seed)
+        draw_fractions = distributions[self.distribution]
+        width = self.amount_max - self.amount_min
+
+        lo = np.concatenate((
+            [self.amount_min.sum()], self.amount_min @ self.category_matrix
+        ))
+        hi = np.concatenate((
+            [self.amount_max.sum()], self.amount_max @ self.category_matrix
+        ))
+        histogram = StreamingHistogram(lo, hi, self.bins)
+
+        chunk_size = self.draws_per_chunk()
+        for start in range(0, n_draws, chunk_size):
+            size = (min(chunk_size, n_draws - start), len(width))
+            costs = self.amount_min + width * draw_fractions(
+                rng, self.mode, size
+            )
+            totals = np.empty((size[0], len(lo)))
+            totals[:, 0] = costs.sum(axis=1)
+            totals[:, 1:] = costs @ self.category_matrix
+            histogram.add(totals)
+
+        return ProjectSimulationResults(
+            self.project.name, self.distribution, self.categories, histogram
+        )
+
+
+class ProjectSimulationResults(object):
+    def __init__(self, name, distribution, categories, histogram):
+        self.name = name
+        self.distribution = distribution
+        self.categories = categories
+        self.histogram = histogram
+
+    def total_percentiles(self, q=(5, 50, 95)):
+        return self.histogram.percentiles(q)[0]
+
+    def category_percentiles(self, q=(5, 50, 95)):
+        P = self.histogram.percentiles(q)[1:]
+        return {cat: P[i] for i, cat in enumerate(self.categories)}
+
+    def print_summary(self, q=(5, 50, 95)):
+        print('Project simulation - %s (%s, %i draws):'
+              % (self.name, self.distribution, self.histogram.n))
+        for cat, P in self.category_percentiles(q).items():
+            print('  %s: %s' % (cat, formated_percentiles(q, P)))
+        print('Total: %s' % formated_percentiles(q, self.total_percentiles(q)))
+
+
+def formated_percentiles(q, P):
+    return ', '.join(
+        'P{0:g} ${1:,.1f}'.format(q_i, p_i) for q_i, p_i in zip(q, P)
+    )
@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
 from matplotlib.collections import LineCollection
 
+from .instrumentation import stage
+
 
 matplotlib.rcParams['figure.figsize'] = (10.0, 8.0)
 # plt.style.use('ggplot')
@@ -40,6 +42,22 @@ plot_formats = {
 }
 
 
+def make_summary_label(label):
+    return '; '.join([
+        '\${:,.0f}'.format(label['principle']),
+        '{:,.0f} y'.format(label['loan_term']),
+        '{:,.1f}% i.r.'.format(label['interest_rate'] * 100),
+        '\${:,.0f} p.w.'.format(label['revenue']),
+        '{:,.1f}% a.r.o.r.'.format(label['annual_rate_of_return'] * 100)
+    ])
+
+
+def best_and_worst_str(best_label, worst_label):
+    return 'best case: %s\nworst case: %s' % (
+        make_summary_label(best_label), make_summary_label(worst_label)
+    )
+
+
 class ResultsPlotter(object):
     def __init__(self,
                  name,
@@ -56,21 +74,34 @@ class ResultsPlotter(object):
 
     def plot_and_savefig(self, file_name):
         plt.figure()
-        self.plot_it()
-        plt.savefig(file_name, bbox_inches='tight')
+        with stage('ResultsPlotter.plot_it'):
+            self.plot_it()
+        with stage('ResultsPlotter.savefig', file_name=file_name):
+            plt.savefig(file_name, bbox_inches='tight')
         plt.close()
 
     def plot_it(self):
         ax = plt.subplot(1, 1, 1)
 
-        ax = self.add_zero_line(ax, self.amount_repayed)
-        ax = self.add_series_and_fill(ax, self.amount_repayed, 'AR', -1)
-        ax = self.add_series_and_fill(ax, self.amount_owing, 'AO', 0)
-        ax = self.add_series_and_fill(ax, self.cumulative_revenue, 'CR', -1)
-        ax = self.add_series_and_fill(ax, self.cumulative_profit, 'CP', -1)
+        # Series that were not computed are None and left out.
+        series_and_codes = [
+            (series, code) for series, code in (
+                (self.amount_repayed, 'AR'),
+                (self.amount_owing, 'AO'),
+                (self.cumulative_revenue, 'CR'),
+                (self.cumulative_profit, 'CP')
+            ) if series is not None
+        ]
+
+        ax = self.add_zero_line(ax, series_and_codes[0][0])
+        for series, code in series_and_codes:
+            ax = self.add_series_and_fill(
+                ax, series, code, 0 if code == 'AO' else -1
+            )
 
         # ax = self.label_series(ax, self.cumulative_profit)
-        ax = self.add_summary_label(ax)
+        if self.cumulative_profit is not None:
+            ax = self.add_summary_label(ax)
 
         plt.title('Oh Cabins - Comparison of Different Scenarios\n%s' % self.name)
         plt.xlabel('Years')
@@ -136,9 +167,9 @@ class ResultsPlotter(object):
         series = self.cumulative_profit
         if series.shape[0] > 1:
             best_i, worst_i = self.max_and_min_index(self.cumulative_profit)
-            best = self.make_summary_label(self.labels[best_i])
-            worst = self.make_summary_label(self.labels[worst_i])
-            label_str = 'best case: %s\nworst case: %s' % (best, worst)
+            label_str = best_and_worst_str(
+                self.labels[best_i], self.labels[worst_i]
+            )
         else:
             single_case = self.make_summary_label(self.labels[0])
             label_str = 'case summary: %s' % single_case
@@ -167,13 +198,7 @@ class ResultsPlotter(object):
         return i_max, i_min
 
     def make_summary_label(self, label):
-        return '; '.join([
-            '\${:,.0f}'.format(label['principle']),
-            '{:,.0f} y'.format(label['loan_term']),
-            '{:,.1f}% i.r.'.format(label['interest_rate'] * 100),
-            '\${:,.0f} p.w.'.format(label['revenue']),
-            '{:,.1f}% a.r.o.r.'.format(label['annual_rate_of_return'] * 100)
-        ])
+        return make_summary_label(label)
 
     def label_series(self, ax, series):
         X = self.make_x(series)
@@ -219,3 +244,210 @@ class ResultsPlotter(object):
             # fontweight='100'
         )
         return ax
+
+
+series_formats = [
+    ('amount_repayed', 'AR'),
+    ('amount_owing', 'AO'),
+    ('cumulative_revenue', 'CR'),
+    ('cumulative_profit', 'CP')
+]
+
+
+class CompactResultsPlotter(ResultsPlotter):
+    # ResultsPlotter for CompactScenarioResults. The series arguments are
+    # series names, drawn as each scenario's compact polyline with the
+    # per-month envelope filled in, so no padded matrix is built.
+    def __init__(self, name, compact):
+        ResultsPlotter.__init__(
+            self, name,
+            'amount_repayed', 'amount_owing',
+            'cumulative_revenue', 'cumulative_profit',
+            compact.labels
+        )
+        self.compact = compact
+
+    def add_series_and_fill(self, ax, series, name, max_axis):
+        collection = LineCollection(
+            self.compact.series_lines(series),
+            colors=self.formats[name]['colour'],
+            label=self.formats[name]['label'],
+            alpha=1
+        )
+        ax.add_collection(collection, autolim=True)
+
+        Y_min, Y_max = self.compact.envelope(series)
+        ax.fill_between(
+            self.make_x(series), Y_min, Y_max,
+            facecolor=self.formats[name]['colour'], alpha=0.4
+        )
+        return ax
+
+    def make_x(self, series):
+        X = np.arange(self.compact.n_months, dtype='float64')
+        X /= 12
+        return X
+
+    def max_and_min_index(self, series):
+        return self.compact.best_and_worst_index()
+
+    def add_summary_label(self, ax):
+        if self.compact.num_scenarios() > 1:
+            best_i, worst_i = self.compact.best_and_worst_index()
+            label_str = best_and_worst_str(
+                self.labels[best_i], self.labels[worst_i]
+            )
+        else:
+            label_str = 'case summary: %s' % make_summary_label(self.labels[0])
+        ax.text(
+            0.02, 0.79,
+            label_str,
+            horizontalalignment='left',
+            transform=ax.transAxes,
+            color=grey_colour,
+            fontsize=10
+        )
+        return ax
+
+
+class DensityPlotter(object):
+    # Draws a MonthlyDensity either as percentile fan bands ('bands') or as
+    # one per-month density heatmap per series ('density').
+    def __init__(self, name, density,
+                 best_label=None, worst_label=None,
+                 mode='bands', percentiles=(5, 25, 50, 75, 95)):
+        if mode not in ('bands', 'density'):
+            raise ValueError('Unknown plot mode %s.' % mode)
+        self.name = name
+        self.density = density
+        self.best_label = best_label
+        self.worst_label = worst_label
+        self.mode = mode
+        self.percentiles = percentiles
+        self.formats = plot_formats
+
+    def plot_and_savefig(self, file_name):
+        plt.figure()
+        if self.mode == 'bands':
+            self.plot_bands()
+        else:
+            self.plot_density()
+        plt.savefig(file_name, bbox_inches='tight')
+        plt.close()
+
+    def make_x(self):
+        X = np.arange(self.density.n_months, dtype='float64')
+        X /= 12
+        return X
+
+    def plot_bands(self):
+        ax = plt.subplot(1, 1, 1)
+        X = self.make_x()
+        ax.plot(X, X * 0, c=grey_colour, linewidth=2, alpha=0.7, zorder=1)
+
+        # Percentiles pair up from the outside in; the odd one out, if any,
+        # is drawn as a line (the median for the default percentiles).
+        n_pairs = len(self.percentiles) // 2
+        for series, code in series_formats:
+            if series not in self.density.histograms:
+                continue
+            format_ = self.formats[code]
+            P = self.density.percentiles(series, self.percentiles)
+            for i in range(n_pairs):
+                ax.fill_between(
+                    X, P[i], P[-1 - i],
+                    facecolor=format_['colour'],
+                    alpha=0.2 + 0.4 * i / max(n_pairs, 1),
+                    linewidth=0
+                )
+            middle = P[n_pairs] if len(self.percentiles) % 2 else P[0]
+            ax.plot(X, middle, c=format_['colour'], label=format_['label'])
+
+        self.add_summary_label(ax)
+        self.finish_axes(ax)
+        plt.title('Oh Cabins - Comparison of Different Scenarios\n%s'
+                  % self.name)
+        legend = plt.legend(loc="upper left", bbox_to_anchor=(0, 1))
+        for text in legend.get_texts():
+            plt.setp(text, color=grey_colour)
+
+    def plot_density(self):
+        X = self.make_x()
+        X_edges = np.append(X, X[-1] + 1 / 12) - 1 / 24
+        for i, (series, code) in enumerate(series_formats):
+            if series not in self.density.histograms:
+                continue
+            ax = plt.subplot(2, 2, i + 1)
+            counts, Y_edges = self.density.density(series)
+            colour = self.formats[code]['colour']
+            ax.pcolormesh(
+                X_edges, Y_edges, np.log1p(counts.T),
+                cmap=matplotlib.colors.LinearSegmentedColormap.from_list(
+                    code, [(1, 1, 1), colour]
+                )
+            )
+            ax.set_title(self.formats[code]['label'], color=grey_colour)
+            self.finish_axes(ax)
+        plt.suptitle('Oh Cabins - Comparison of Different Scenarios\n%s'
+                     % self.name)
+        plt.tight_layout()
+
+    def add_summary_label(self, ax):
+        if self.best_label is None or self.worst_label is None:
+            return ax
+        ax.text(
+            0.02, 0.79,
+            best_and_worst_str(self.best_label, self.worst_label),
+            horizontalalignment='left',
+            transform=ax.transAxes,
+            color=grey_colour,
+            fontsize=10
+        )
+        return ax
+
+    def finish_axes(self, ax):
+        ax.set_xlabel('Years')
+        yl = ax.set_ylabel('$  ')
+        yl.set_rotation(0)
+        ax.get_yaxis().set_major_formatter(
+            FuncFormatter(lambda x, p: format(x, ',.0f'))
+        )
+        return ax
+
+
+class TornadoPlotter(object):
+    # Horizontal bars of a metric's low and high values as each parameter
+    # is moved on its own, widest swing at the top.
+    def __init__(self, name, metric, base, bars):
+        self.name = name
+        self.metric = metric
+        self.base = base
+        self.bars = bars
+
+    def plot_and_savefig(self, file_name):
+        plt.figure()
+        self.plot_it()
+        plt.savefig(file_name, bbox_inches='tight')
+        plt.close()
+
+    def plot_it(self):
+        ax = plt.subplot(1, 1, 1)
+        y = np.arange(len(self.bars))[::-1]
+        for i, (y_i, (parameter, low, high)) in enumerate(zip(y, self.bars)):
+            ax.barh(y_i, low - self.base, left=self.base,
+                    color=plot_formats['AR']['colour'],
+                    label='low' if i == 0 else None)
+            ax.barh(y_i, high - self.base, left=self.base,
+                    color=plot_formats['CR']['colour'],
+                    label='high' if i == 0 else None)
+        ax.axvline(self.base, color=grey_colour, linewidth=2)
+        legend = plt.legend(loc='lower right')
+        for text in legend.get_texts():
+            plt.setp(text, color=grey_colour)
+        ax.set_yticks(y)
+        ax.set_yticklabels([b[0].replace('_', ' ') for b in self.bars])
+        ax.get_xaxis().set_major_formatter(
+            FuncFormatter(lambda x, p: format(x, ',.0f'))
+        )
+        plt.title('Oh Cabins - Sensitivity of %s\n%s'
+                  % (self.metric.replace('_', ' '), self.name))
@@ -0,0 +1,55 @@
+import numpy as np
+
+from .scenario_grid import merge_ranges, series_names, value_ranges
+from .streaming_stats import StreamingHistogram
+
+
+class MonthlyDensity(object):
+    # Per-month histograms of each monthly series, on one fixed value range
+    # per series, filled from results chunk by chunk. Memory and plotting
+    # cost are n_months x bins whatever the number of scenarios. Only the
+    # series given bounds are kept.
+    def __init__(self, bounds, n_months, bins=256):
+        self.bounds = bounds
+        self.n_months = n_months
+        self.bins = bins
+        self.histograms = {
+            k: StreamingHistogram(
+                np.full(n_months, bounds[k][0]),
+                np.full(n_months, bounds[k][1]),
+                bins
+            )
+            for k in series_names if k in bounds
+        }
+
+    @classmethod
+    def from_source(cls, source, chunk_size=1000000, bins=256):
+        # Bounds come from the closed forms, so this costs O(n_scenarios)
+        # and leaves the monthly matrices to the caller's own pass.
+        bounds = {}
+        n = source.num_scenarios()
+        for start in range(0, n, chunk_size):
+            grid = source.chunk(start, start + chunk_size)
+            merge_ranges(bounds, grid.series_bounds())
+        return cls(bounds, grid.max_num_periods() + 1, bins)
+
+    @classmethod
+    def from_results(cls, results, bins=256):
+        series = results.computed_series()
+        bounds = value_ranges({k: getattr(results, k) for k in series})
+        density = cls(bounds, getattr(results, series[0]).shape[1], bins)
+        density.add(results)
+        return density
+
+    def add(self, results):
+        for k in self.histograms:
+            self.histograms[k].add(getattr(results, k))
+
+    def percentiles(self, k, q=(5, 25, 50, 75, 95)):
+        # One row per percentile in q, one column per month.
+        return self.histograms[k].percentiles(q).T
+
+    def density(self, k):
+        # (n_months, bins) counts and the bins' value edges.
+        lo, hi = self.bounds[k]
+        return self.histograms[k].counts, np.linspace(lo, hi, self.bins + 1)
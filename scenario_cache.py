@@ -0,0 +1,168 @@
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+from .scenario_grid import series_names
+from .scenario_testing import GridScenarioTester, ScenarioTestResults
+
+
+class ScenarioResultCache(object):
+    # On-disk store of evaluated scenario rows, keyed by each scenario's
+    # parameters and max_loan_term. Every evaluation is written as one
+    # block directory named by the hash of its keys, in the
+    # ScenarioTestResults.save layout, and least recently used blocks are
+    # evicted once the store grows past max_bytes.
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.build_index()
+
+    def build_index(self):
+        # Other caches on the same directory may evict blocks at any time,
+        # so a block that disappears while indexing is left out.
+        keys, blocks, rows = [], [], []
+        self.blocks = []
+        for b in sorted(os.listdir(self.directory)):
+            try:
+                k = as_void(np.load(os.path.join(self.directory, b, 'keys.npy')))
+            except FileNotFoundError:
+                continue
+            keys.append(k)
+            blocks.append(np.full(len(k), len(self.blocks)))
+            rows.append(np.arange(len(k)))
+            self.blocks.append(b)
+
+        if keys:
+            keys = np.concatenate(keys)
+            order = np.argsort(keys, kind='stable')
+            self.keys = keys[order]
+            self.key_blocks = np.concatenate(blocks)[order]
+            self.key_rows = np.concatenate(rows)[order]
+        else:
+            self.keys = as_void(np.zeros((0, 8)))
+            self.key_blocks = np.zeros(0, dtype='int64')
+            self.key_rows = np.zeros(0, dtype='int64')
+
+    def lookup(self, keys):
+        # Block and row of each key, or -1 where it is not cached.
+        keys = as_void(keys)
+        i = np.searchsorted(self.keys, keys)
+        i = np.minimum(i, max(len(self.keys) - 1, 0))
+        if len(self.keys) == 0:
+            missing = np.full(len(keys), -1)
+            return missing, missing
+        found = self.keys[i] == keys
+        return (
+            np.where(found, self.key_blocks[i], -1),
+            np.where(found, self.key_rows[i], -1)
+        )
+
+    def read(self, block, rows):
+        # The series of rows in block, or None if the block has been
+        # evicted since the index was built, in which case they are misses.
+        path = os.path.join(self.directory, self.blocks[block])
+        try:
+            os.utime(path)
+            results = ScenarioTestResults.load(path)
+            return {k: getattr(results, k)[rows] for k in series_names}
+        except FileNotFoundError:
+            return None
+
+    def write(self, keys, results):
+        name = hashlib.sha1(np.ascontiguousarray(keys).tobytes()).hexdigest()
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            results.save(path)
+            np.save(os.path.join(path, 'keys.npy'), keys)
+        self.evict()
+
+    def evict(self):
+        # Removes least recently used blocks until the store fits in
+        # max_bytes, then re-indexes what is left.
+        blocks = []
+        for b in os.listdir(self.directory):
+            path = os.path.join(self.directory, b)
+            try:
+                blocks.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        blocks.sort()
+        sizes = [directory_size(b) for _, b in blocks]
+        total = sum(sizes)
+        for (_, b), size in zip(blocks, sizes):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(b, ignore_errors=True)
+            total -= size
+        self.build_index()
+
+    def size(self):
+        return sum(
+            directory_size(os.path.join(self.directory, b))
+            for b in os.listdir(self.directory)
+        )
+
+
+class CachedScenarioTester(object):
+    # Like GridScenarioTester, but only scenarios missing from the cache
+    # are evaluated; cached rows are read back and assembled in place.
+    def __init__(self, name, source, cache):
+        self.name = name
+        self.source = source
+        self.cache = cache
+
+    def test(self):
+        grid = self.source.chunk(0, self.source.num_scenarios())
+        keys = grid.parameter_keys()
+        blocks, rows = self.cache.lookup(keys)
+
+        n_months = grid.max_num_periods() + 1
+        series = {
+            k: np.empty((grid.num_scenarios(), n_months)) for k in series_names
+        }
+
+        # Hits are read before the write below re-indexes the cache. Rows
+        # of a block evicted meanwhile by another cache are recomputed.
+        for b in np.unique(blocks[blocks >= 0]):
+            hits = np.flatnonzero(blocks == b)
+            cached = self.cache.read(b, rows[hits])
+            if cached is None:
+                blocks[hits] = -1
+                continue
+            for k in series_names:
+                series[k][hits] = cached[k]
+
+        missing = np.flatnonzero(blocks < 0)
+        if len(missing):
+            results = GridScenarioTester(self.name, grid.take(missing)).test()
+            for k in series_names:
+                series[k][missing] = getattr(results, k)
+            self.cache.write(keys[missing], results)
+
+        return ScenarioTestResults(
+            self.name,
+            grid.annual_interest_rate,
+            series['amount_repayed'], series['amount_owing'],
+            series['cumulative_revenue'], series['cumulative_profit'],
+            grid.calculate_annual_rates_of_return(),
+            grid.labels()
+        )
+
+
+def as_void(keys):
+    keys = np.ascontiguousarray(keys, dtype='float64')
+    return keys.view(np.dtype((np.void, keys.shape[1] * 8))).ravel()
+
+
+def directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except FileNotFoundError:
+                pass
+    return size
@@ -0,0 +1,253 @@
+import numpy as np
+
+from .scenario_grid import repayment_growth, series_names, value_ranges
+from .scenario_testing import ScenarioSummary, ScenarioTestResults
+
+
+class CompactScenarioTester(object):
+    # Evaluates a ScenarioCollection (or ScenarioGrid) straight into
+    # CompactScenarioResults, without building the padded matrices.
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+
+    def test(self):
+        grid = self.source.chunk(0, self.source.num_scenarios())
+        return CompactScenarioResults.from_grid(self.name, grid)
+
+
+class CompactScenarioResults(object):
+    # Term-aware storage of a sweep. Repayments and amounts owing are kept
+    # only for each loan's active months, months 0 to floor(term), as one
+    # flat array with row offsets. Past the term, the amount repayed stays
+    # at repayed_tail and the amount owing is zero. Revenue is flat at
+    # monthly_revenue after lead_months, so it is stored as those two
+    # numbers alone, and profit is revenue less repayments.
+    def __init__(self,
+                 name,
+                 interest_rate,
+                 offsets, amount_repayed, amount_owing, repayed_tail,
+                 lead_months, monthly_revenue,
+                 annual_rates_of_return,
+                 labels,
+                 n_months):
+        self.name = name
+        self.interest_rate = interest_rate
+        self.offsets = offsets
+        self.amount_repayed = amount_repayed
+        self.amount_owing = amount_owing
+        self.repayed_tail = repayed_tail
+        self.lead_months = lead_months
+        self.monthly_revenue = monthly_revenue
+        self.annual_rates_of_return = annual_rates_of_return
+        self.labels = labels
+        self.n_months = n_months
+
+    @classmethod
+    def from_grid(cls, name, grid):
+        last = grid.max_num_periods()
+        n = grid.number_of_periods()
+        lengths = np.minimum(np.floor(n), last).astype('int64') + 1
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        row = np.repeat(np.arange(grid.num_scenarios()), lengths)
+        month = (np.arange(offsets[-1]) - offsets[row]).astype('float64')
+        r = grid.montly_interest()[row]
+        c = grid.calculate_repayment_amounts()
+
+        # The same operations as ScenarioGrid's monthly matrices, so the
+        # dense view matches GridScenarioTester to the last bit.
+        amount_repayed = np.minimum(month, n[row]) * c[row]
+        growth = (1 + r) ** month
+        amount_owing = grid.principle[row] * growth - \
+            c[row] * repayment_growth(growth, r, month)
+
+        return cls(
+            name,
+            grid.annual_interest_rate,
+            offsets, amount_repayed, amount_owing, n * c,
+            grid.lead_time_in_months(), grid.montly_revenue(),
+            grid.calculate_annual_rates_of_return(),
+            grid.labels(),
+            last + 1
+        )
+
+    def num_scenarios(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def nbytes(self):
+        return sum(
+            X.nbytes for X in (
+                self.offsets, self.amount_repayed, self.amount_owing,
+                self.repayed_tail, self.lead_months, self.monthly_revenue
+            )
+        )
+
+    def dense_nbytes(self):
+        return len(series_names) * self.num_scenarios() * self.n_months * 8
+
+    def value_at(self, k, month):
+        # Series k at one month per scenario (or one month for all).
+        month = np.broadcast_to(month, (self.num_scenarios(),))
+        if k == 'cumulative_profit':
+            return self.value_at('cumulative_revenue', month) - \
+                self.value_at('amount_repayed', month)
+        if k == 'cumulative_revenue':
+            X = month - self.lead_months
+            return np.maximum(X, 0) * self.monthly_revenue
+
+        values = getattr(self, k)
+        active = month < self.lengths()
+        i = np.minimum(self.offsets[:-1] + month, max(len(values) - 1, 0))
+        tail = self.repayed_tail if k == 'amount_repayed' else 0.0
+        return np.where(active, values[i], tail)
+
+    def dense(self, k, start=0, stop=None):
+        # (scenarios, months) matrix of series k for rows start to stop,
+        # equal to the matching GridScenarioTester matrix.
+        stop = self.num_scenarios() if stop is None else \
+            min(stop, self.num_scenarios())
+        if k == 'cumulative_profit':
+            return self.dense('cumulative_revenue', start, stop) - \
+                self.dense('amount_repayed', start, stop)
+        if k == 'cumulative_revenue':
+            X = np.arange(self.n_months, dtype='float64')[None, :] - \
+                self.lead_months[start:stop, None]
+            X[X < 0] = 0
+            X *= self.monthly_revenue[start:stop, None]
+            return X
+
+        shape = (stop - start, self.n_months)
+        if k == 'amount_repayed':
+            X = np.repeat(self.repayed_tail[start:stop, None], shape[1], axis=1)
+        else:
+            X = np.zeros(shape)
+        offsets = self.offsets[start:stop + 1]
+        row = np.repeat(np.arange(shape[0]), np.diff(offsets))
+        month = np.arange(offsets[-1] - offsets[0]) - (offsets[row] - offsets[0])
+        X[row, month] = getattr(self, k)[offsets[0]:offsets[-1]]
+        return X
+
+    def to_results(self, start=0, stop=None):
+        stop = self.num_scenarios() if stop is None else stop
+        return ScenarioTestResults(
+            self.name,
+            self.interest_rate[start:stop],
+            *[self.dense(k, start, stop) for k in series_names],
+            self.annual_rates_of_return[start:stop],
+            self.labels.take(slice(start, stop))
+        )
+
+    def chunks(self, chunk_size=10000):
+        for start in range(0, self.num_scenarios(), chunk_size):
+            yield start, self.to_results(start, start + chunk_size)
+
+    def summary_figures(self):
+        last = self.n_months - 1
+        final_profit = self.value_at('cumulative_profit', last)
+        final_revenue = self.value_at('cumulative_revenue', last)
+        return {
+            'interest_rate': np.asarray(self.interest_rate),
+            'total_cost': self.value_at('amount_owing', 0),
+            'monthly_repayment': self.value_at('amount_repayed', 1),
+            'monthly_revenue':
+                final_revenue - self.value_at('cumulative_revenue', last - 1),
+            'monthly_profit':
+                final_profit - self.value_at('cumulative_profit', last - 1),
+            'total_profit': final_profit,
+            'annual_rate_of_return': np.asarray(self.annual_rates_of_return)
+        }
+
+    def best_and_worst_index(self):
+        final_profit = self.value_at('cumulative_profit', self.n_months - 1)
+        return np.argmax(final_profit), np.argmin(final_profit)
+
+    def summary(self):
+        figures = self.summary_figures()
+        best_i, worst_i = self.best_and_worst_index()
+        return ScenarioSummary(
+            self.name,
+            value_ranges(figures),
+            self.labels[best_i], self.labels[worst_i]
+        )
+
+    def summarise(self):
+        self.summary().summarise()
+
+    def envelope(self, k, chunk_size=10000):
+        # Per-month (min, max) of series k, densified chunk_size rows at a
+        # time.
+        Y_min, Y_max = None, None
+        for start in range(0, self.num_scenarios(), chunk_size):
+            X = self.dense(k, start, start + chunk_size)
+            if Y_min is None:
+                Y_min, Y_max = np.min(X, axis=0), np.max(X, axis=0)
+            else:
+                Y_min = np.minimum(Y_min, np.min(X, axis=0))
+                Y_max = np.maximum(Y_max, np.max(X, axis=0))
+        return Y_min, Y_max
+
+    def series_lines(self, k):
+        # One polyline per scenario, in (years, value) points, tracing the
+        # same path as the dense monthly series. Owing goes through every
+        # stored month; the other series are straight between the lead
+        # time and term breakpoints, so only those are drawn.
+        last = self.n_months - 1
+        if k == 'amount_owing':
+            lengths = self.lengths()
+            values = np.split(self.amount_owing, self.offsets[1:-1])
+            lines = []
+            for length, Y in zip(lengths, values):
+                tail_months = [] if length > last else sorted({length, last})
+                line = np.zeros((length + len(tail_months), 2))
+                line[:length, 0] = np.arange(length)
+                line[length:, 0] = tail_months
+                line[:length, 1] = Y
+                line[:, 0] /= 12
+                lines.append(line)
+            return lines
+
+        L = self.lead_months
+        n = (self.lengths() - 1).astype('float64')
+        breakpoints = {
+            'amount_repayed': [n, n + 1],
+            'cumulative_revenue': [np.floor(L), np.ceil(L)],
+            'cumulative_profit': [np.floor(L), np.ceil(L), n, n + 1]
+        }[k]
+        months = np.stack(
+            [np.zeros_like(L)] + breakpoints + [np.full_like(L, last)], axis=1
+        )
+        months = np.sort(np.clip(months, 0, last), axis=1).astype('int64')
+
+        lines = np.zeros(months.shape + (2,))
+        lines[:, :, 0] = months / 12
+        for j in range(months.shape[1]):
+            lines[:, j, 1] = self.value_at(k, months[:, j])
+        return lines
+
+    def density(self, bins=256, chunk_size=10000):
+        from .scenario_bands import MonthlyDensity
+
+        bounds = {}
+        for k in series_names:
+            Y_min, Y_max = self.envelope(k, chunk_size)
+            bounds[k] = (np.min(Y_min), np.max(Y_max))
+        density = MonthlyDensity(bounds, self.n_months, bins)
+        for start, results in self.chunks(chunk_size):
+            density.add(results)
+        return density
+
+    def plot(self, file_name, mode='lines', bins=256):
+        from .results_plotter import CompactResultsPlotter, DensityPlotter
+
+        if mode == 'lines':
+            CompactResultsPlotter(self.name, self).plot_and_savefig(file_name)
+        else:
+            best_i, worst_i = self.best_and_worst_index()
+            DensityPlotter(
+                self.name, self.density(bins),
+                self.labels[best_i], self.labels[worst_i], mode
+            ).plot_and_savefig(file_name)
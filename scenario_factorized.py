@@ -0,0 +1,141 @@
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+from .scenario_grid import ScenarioGrid
+from .scenario_testing import ScenarioTestResults
+
+
+class CurveCache(object):
+    # Least recently used cache of monthly curves, least recently used
+    # evicted once the curves held grow past max_bytes. A curve is an
+    # array or a tuple of arrays.
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.curves = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key):
+        curve = self.curves.get(key)
+        if curve is not None:
+            self.curves.move_to_end(key)
+        return curve
+
+    def put(self, key, curve):
+        # Curves are copied: a row of a larger array would otherwise keep
+        # the whole array alive while counting only the row's bytes.
+        if isinstance(curve, tuple):
+            curve = tuple(np.array(c) for c in curve)
+        else:
+            curve = np.array(curve)
+        if key in self.curves:
+            self.nbytes -= curve_nbytes(self.curves.pop(key))
+        self.curves[key] = curve
+        self.nbytes += curve_nbytes(curve)
+        while self.nbytes > self.max_bytes and self.curves:
+            _, evicted = self.curves.popitem(last=False)
+            self.nbytes -= curve_nbytes(evicted)
+
+    def __len__(self):
+        return len(self.curves)
+
+
+def curve_nbytes(curve):
+    if isinstance(curve, tuple):
+        return sum(c.nbytes for c in curve)
+    return curve.nbytes
+
+
+class FactorizedScenarioTester(object):
+    # Loan curves depend only on (principle, interest rate, interest only,
+    # term) and revenue curves only on (lead time, revenue unit), so each
+    # distinct curve is computed once and profit is their outer difference.
+    def __init__(self, name, collection, cache=None):
+        self.name = name
+        self.collection = collection
+        self.cache = cache if cache is not None else CurveCache()
+
+    def test(self):
+        c = self.collection
+        loan_keys = list(itertools.product(
+            c.principles, c.annual_interest_rates,
+            c.interest_only, c.loan_terms_in_years
+        ))
+        revenue_keys = list(itertools.product(
+            c.lead_times_in_years, c.revenue_units
+        ))
+
+        amount_repayed, amount_owing = self.loan_curves(loan_keys)
+        revenue = self.revenue_curves(revenue_keys)
+
+        n_loans, n_revenues = len(loan_keys), len(revenue_keys)
+        n_months = revenue.shape[1]
+        amount_repayed_by_month = np.repeat(amount_repayed, n_revenues, axis=0)
+        amount_owing_by_month = np.repeat(amount_owing, n_revenues, axis=0)
+        cumulative_revenue = np.tile(revenue, (n_loans, 1))
+        cumulative_profit = (
+            revenue[None, :, :] - amount_repayed[:, None, :]
+        ).reshape(n_loans * n_revenues, n_months)
+
+        grid = c.grid()
+        return ScenarioTestResults(
+            self.name,
+            grid.annual_interest_rate,
+            amount_repayed_by_month, amount_owing_by_month,
+            cumulative_revenue, cumulative_profit,
+            grid.calculate_annual_rates_of_return(),
+            grid.labels()
+        )
+
+    def loan_curves(self, loan_keys):
+        max_loan_term = self.collection.max_loan_length()
+
+        def compute(missing):
+            p, ir, io, lt = zip(*[k[2:] for k in missing])
+            grid = ScenarioGrid(
+                self.name, p, ir, io, lt, 0, 0, 0, max_loan_term
+            )
+            return list(zip(
+                grid.calculate_amounts_repayed_by_month(),
+                grid.calculate_amounts_owing_by_month()
+            ))
+
+        keys = [('loan', max_loan_term) + k for k in loan_keys]
+        curves = self.lookup(keys, compute)
+        return (
+            np.array([curves[k][0] for k in keys]),
+            np.array([curves[k][1] for k in keys])
+        )
+
+    def revenue_curves(self, revenue_keys):
+        max_loan_term = self.collection.max_loan_length()
+        factor = self.collection.annual_revenue_factor
+
+        def compute(missing):
+            ld, ru = zip(*[k[3:] for k in missing])
+            grid = ScenarioGrid(
+                self.name, 1, 0, False, 0, ld, ru, factor, max_loan_term
+            )
+            return list(grid.calculate_cumulative_revenues_by_month())
+
+        keys = [('revenue', max_loan_term, factor) + k for k in revenue_keys]
+        curves = self.lookup(keys, compute)
+        return np.array([curves[k] for k in keys])
+
+    def lookup(self, keys, compute):
+        # Curves are gathered locally first so a cache smaller than one
+        # sweep still returns every curve the sweep needs.
+        curves = OrderedDict()
+        missing = []
+        for k in keys:
+            if k not in curves:
+                curves[k] = self.cache.get(k)
+                if curves[k] is None:
+                    missing.append(k)
+
+        if missing:
+            for k, curve in zip(missing, compute(missing)):
+                curves[k] = curve
+                self.cache.put(k, curve)
+        return curves
@@ -0,0 +1,95 @@
+import numpy as np
+
+from .scenario_grid import amortised_repayments
+
+
+def payback_or_inf(months):
+    # Payback never reached counts as infinitely late, which keeps the
+    # metric monotone for bisection.
+    return np.where(months < 0, np.inf, months)
+
+
+goal_metrics = {
+    'cumulative_profit':
+        lambda grid, month: grid.calculate_cumulative_profits_at(month),
+    'cumulative_revenue':
+        lambda grid, month: grid.calculate_cumulative_revenues_at(month),
+    'amount_repayed':
+        lambda grid, month: grid.calculate_amounts_repayed_at(month),
+    'amount_owing':
+        lambda grid, month: grid.calculate_amounts_owing_at(month),
+    'annual_rate_of_return':
+        lambda grid, month: grid.calculate_annual_rates_of_return(),
+    'payback_month':
+        lambda grid, month: payback_or_inf(grid.calculate_payback_months())
+}
+
+
+class GoalSeeker(object):
+    # Solves one target problem per row of a ScenarioGrid: find the value
+    # of one parameter at which a metric hits a target, holding the row's
+    # other parameters fixed. All rows are bisected together.
+    def __init__(self, grid, tolerance=1e-9, max_iterations=200):
+        self.grid = grid
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+    def solve(self, parameter, metric, target, lo, hi, month=None):
+        # Returns the parameter value per row, or nan where the metric does
+        # not cross the target between lo and hi. month applies to the
+        # cumulative metrics and defaults to the end of the horizon.
+        if metric not in goal_metrics:
+            raise ValueError(
+                'Unknown metric %s, expected one of %s.'
+                % (metric, ', '.join(sorted(goal_metrics)))
+            )
+        if month is None:
+            month = self.grid.max_num_periods()
+        n = self.grid.num_scenarios()
+        lo = np.broadcast_to(np.asarray(lo, dtype='float64'), n).copy()
+        hi = np.broadcast_to(np.asarray(hi, dtype='float64'), n).copy()
+        target = np.broadcast_to(np.asarray(target, dtype='float64'), n)
+
+        def gap(x):
+            grid = self.grid.replace(**{parameter: x})
+            return goal_metrics[metric](grid, month) - target
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g_lo = gap(lo)
+            g_hi = gap(hi)
+            solvable = np.sign(g_lo) != np.sign(g_hi)
+            solvable |= (g_lo == 0) | (g_hi == 0)
+
+            for _ in range(self.max_iterations):
+                width = hi - lo
+                scale = np.maximum(1, np.maximum(np.abs(lo), np.abs(hi)))
+                if np.all(width[solvable] <= self.tolerance * scale[solvable]):
+                    break
+                mid = (lo + hi) / 2
+                g_mid = gap(mid)
+                left = np.sign(g_mid) == np.sign(g_lo)
+                lo = np.where(left, mid, lo)
+                g_lo = np.where(left, g_mid, g_lo)
+                hi = np.where(left, hi, mid)
+
+        return np.where(solvable, (lo + hi) / 2, np.nan)
+
+    def max_affordable_principle(self, month=None, target_profit=0):
+        # Closed form of solving cumulative profit at month = target for
+        # the principle: repayments are linear in the principle.
+        g = self.grid
+        if month is None:
+            month = g.max_num_periods()
+        r = g.montly_interest()
+        n = g.number_of_periods()
+        per_dollar = np.where(
+            g.interest_only, r, amortised_repayments(r, 1, n)
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            revenue = g.calculate_cumulative_revenues_at(month)
+            return (revenue - target_profit) / \
+                (per_dollar * np.minimum(month, n))
+
+    def min_revenue_unit_for_return(self, annual_rate_of_return):
+        g = self.grid
+        return annual_rate_of_return * g.principle / g.annual_revenue_factor
@@ -0,0 +1,375 @@
+import numpy as np
+
+
+series_names = [
+    'amount_repayed', 'amount_owing', 'cumulative_revenue', 'cumulative_profit'
+]
+
+
+# The loan formulas divide by the monthly rate r; at r = 0 they take their
+# limits instead, an even split of the principle over the term and a
+# balance that falls by one payment a month.
+def amortised_repayments(r, p, n):
+    r = np.asarray(r, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(r != 0, r * p / (1 - (1 + r) ** -n), p / n)
+
+
+def repayment_growth(growth, r, N):
+    # Sum of (1 + r) ** k for k < N, which times the payment is what the
+    # payments so far have taken off the grown principle.
+    r = np.asarray(r, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(r != 0, (growth - 1) / r, N)
+
+
+def merge_ranges(ranges, bounds):
+    # Widens each (lo, hi) in ranges, in place, to cover the chunk's
+    # bounds; pass value_ranges(figures) for arrays of values.
+    for k, (lo, hi) in bounds.items():
+        if k in ranges:
+            lo, hi = min(ranges[k][0], lo), max(ranges[k][1], hi)
+        ranges[k] = (lo, hi)
+    return ranges
+
+
+def value_ranges(figures):
+    return {k: (np.min(X), np.max(X)) for k, X in figures.items()}
+
+
+class ScenarioGrid(object):
+    # Struct-of-arrays counterpart of Scenario: one array per parameter,
+    # every calculation returns one row per scenario.
+    def __init__(self,
+                 name,
+                 principle, annual_interest_rate, interest_only,
+                 loan_term_in_years, lead_time_in_years,
+                 revenue_unit, annual_revenue_factor,
+                 max_loan_term):
+        (principle, annual_interest_rate, interest_only,
+         loan_term_in_years, lead_time_in_years,
+         revenue_unit, annual_revenue_factor) = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(principle, dtype='float64')),
+            np.asarray(annual_interest_rate, dtype='float64'),
+            np.asarray(interest_only, dtype=bool),
+            np.asarray(loan_term_in_years, dtype='float64'),
+            np.asarray(lead_time_in_years, dtype='float64'),
+            np.asarray(revenue_unit, dtype='float64'),
+            np.asarray(annual_revenue_factor, dtype='float64')
+        )
+
+        self.name = name
+        self.principle = principle
+        self.annual_interest_rate = annual_interest_rate
+        self.interest_only = interest_only
+        self.loan_term_in_years = loan_term_in_years
+        self.lead_time_in_years = lead_time_in_years
+        self.revenue_unit = revenue_unit
+        self.annual_revenue_factor = annual_revenue_factor
+        self.annual_revenue = revenue_unit * annual_revenue_factor
+        self.max_loan_term = max_loan_term
+
+    @classmethod
+    def from_scenarios(cls, name, scenarios):
+        revenue_unit = np.array([s.revenue_unit for s in scenarios], 'float64')
+        annual_revenue = np.array([s.annual_revenue for s in scenarios], 'float64')
+        factor = np.divide(
+            annual_revenue, revenue_unit,
+            out=np.zeros_like(annual_revenue), where=revenue_unit != 0
+        )
+        return cls(
+            name,
+            [s.principle for s in scenarios],
+            [s.annual_interest_rate for s in scenarios],
+            [s.interest_only for s in scenarios],
+            [s.loan_term_in_years for s in scenarios],
+            [s.lead_time_in_years for s in scenarios],
+            revenue_unit, factor,
+            max(s.max_loan_term for s in scenarios)
+        )
+
+    @classmethod
+    def concatenate(cls, name, grids):
+        # One grid of every scenario in grids, in order, evaluated to the
+        # longest of their horizons.
+        def joined(k):
+            return np.concatenate([getattr(g, k) for g in grids])
+
+        return cls(
+            name,
+            joined('principle'),
+            joined('annual_interest_rate'),
+            joined('interest_only'),
+            joined('loan_term_in_years'),
+            joined('lead_time_in_years'),
+            joined('revenue_unit'),
+            joined('annual_revenue_factor'),
+            max(g.max_loan_term for g in grids)
+        )
+
+    def num_scenarios(self):
+        return len(self.principle)
+
+    def chunk(self, start, stop):
+        return self.take(slice(start, stop))
+
+    def take(self, rows):
+        return ScenarioGrid(
+            self.name,
+            self.principle[rows],
+            self.annual_interest_rate[rows],
+            self.interest_only[rows],
+            self.loan_term_in_years[rows],
+            self.lead_time_in_years[rows],
+            self.revenue_unit[rows],
+            self.annual_revenue_factor[rows],
+            self.max_loan_term
+        )
+
+    def replace(self, **parameters):
+        # Copy of the grid with some parameter arrays swapped out, e.g.
+        # grid.replace(principle=new_principles).
+        fields = {
+            'principle': self.principle,
+            'annual_interest_rate': self.annual_interest_rate,
+            'interest_only': self.interest_only,
+            'loan_term_in_years': self.loan_term_in_years,
+            'lead_time_in_years': self.lead_time_in_years,
+            'revenue_unit': self.revenue_unit,
+            'annual_revenue_factor': self.annual_revenue_factor,
+            'max_loan_term': self.max_loan_term
+        }
+        unknown = set(parameters) - set(fields)
+        if unknown:
+            raise ValueError('Unknown scenario parameters: %s' % sorted(unknown))
+        fields.update(parameters)
+        return ScenarioGrid(self.name, **fields)
+
+    def parameter_keys(self):
+        # One row of every input that determines a scenario's curves.
+        # Adding 0.0 folds -0.0 into 0.0 so equal values give equal bytes.
+        return np.stack([
+            self.principle,
+            self.annual_interest_rate,
+            self.interest_only.astype('float64'),
+            self.loan_term_in_years,
+            self.lead_time_in_years,
+            self.revenue_unit,
+            self.annual_revenue_factor,
+            np.full(self.num_scenarios(), self.max_loan_term, dtype='float64')
+        ], axis=1) + 0.0
+
+    def calculate_repayment_amounts(self):
+        r = self.montly_interest()
+        p = self.principle
+        n = self.number_of_periods()
+
+        return np.where(
+            self.interest_only, r * p, amortised_repayments(r, p, n)
+        )
+
+    def calculate_amounts_repayed_by_month(self):
+        X = np.minimum(self.months(), self.number_of_periods()[:, None])
+        X *= self.calculate_repayment_amounts()[:, None]
+        return X
+
+    def calculate_amounts_owing_by_month(self):
+        r = self.montly_interest()[:, None]
+        months = self.months()
+        active = months <= self.number_of_periods()[:, None]
+        P = np.where(active, self.principle[:, None], 0.0)
+        N = np.where(active, months, 0.0)
+        c = self.calculate_repayment_amounts()[:, None]
+
+        growth = (1 + r) ** N
+        P_f = P * growth - c * repayment_growth(growth, r, N)
+        return P_f
+
+    def calculate_cumulative_revenues_by_month(self):
+        X = self.months() - self.lead_time_in_months()[:, None]
+        X[X < 0] = 0
+        X *= self.montly_revenue()[:, None]
+        return X
+
+    def calculate_annual_rates_of_return(self):
+        return self.annual_revenue / self.principle
+
+    def calculate_amounts_repayed_at(self, month):
+        return np.minimum(month, self.number_of_periods()) * \
+            self.calculate_repayment_amounts()
+
+    def calculate_amounts_owing_at(self, month):
+        r = self.montly_interest()
+        active = month <= self.number_of_periods()
+        P = np.where(active, self.principle, 0.0)
+        N = np.where(active, month, 0.0)
+        c = self.calculate_repayment_amounts()
+
+        growth = (1 + r) ** N
+        return P * growth - c * repayment_growth(growth, r, N)
+
+    def calculate_cumulative_revenues_at(self, month):
+        X = np.maximum(month - self.lead_time_in_months(), 0)
+        return X * self.montly_revenue()
+
+    def calculate_cumulative_profits_at(self, month):
+        return self.calculate_cumulative_revenues_at(month) - \
+            self.calculate_amounts_repayed_at(month)
+
+    def calculate_payback_months(self):
+        # First month >= 1 where cumulative profit is non-negative, or -1 if
+        # that is not reached by max_num_periods(). Profit is
+        # R max(m - L, 0) - c min(m, n), a convex piecewise linear curve
+        # through zero, so it crosses zero at most once after month 0.
+        R = self.montly_revenue()
+        L = self.lead_time_in_months()
+        n = self.number_of_periods()
+        c = self.calculate_repayment_amounts()
+        horizon = self.max_num_periods()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            during_loan = np.where(R > c, R * L / (R - c), np.inf)
+            during_loan = np.where((R == c) & (L == 0), 0, during_loan)
+            after_loan = np.where(R > 0, L + c * n / R, np.inf)
+        crossing = np.where(during_loan <= n, during_loan, after_loan)
+        crossing = np.where(c <= 0, 0, crossing)
+        crossing = np.minimum(crossing, horizon + 2)
+
+        m = np.maximum(np.ceil(crossing), 1)
+        earlier = (m > 1) & (self.calculate_cumulative_profits_at(m - 1) >= 0)
+        m = np.where(earlier, m - 1, m)
+        m = np.where(self.calculate_cumulative_profits_at(m) < 0, m + 1, m)
+        return np.where(m > horizon, -1, m).astype('int64')
+
+    def calculate_revenue_cover_months(self):
+        # First month where cumulative revenue exceeds the amount owing, or
+        # -1 if never. Revenue never falls and owing never rises, so the
+        # month is found by a bisection run for all scenarios at once.
+        # Owing is clamped at zero to drop rounding residue at the term end.
+        horizon = self.max_num_periods()
+
+        def covered(month):
+            owing = np.maximum(self.calculate_amounts_owing_at(month), 0)
+            return self.calculate_cumulative_revenues_at(month) > owing
+
+        lo = np.full(self.num_scenarios(), -1, dtype='int64')
+        hi = np.full(self.num_scenarios(), horizon, dtype='int64')
+        while np.any(hi - lo > 1):
+            mid = (lo + hi) // 2
+            ok = covered(mid)
+            hi = np.where(ok, mid, hi)
+            lo = np.where(ok, lo, mid)
+        return np.where(covered(hi), hi, -1)
+
+    def series_bounds(self):
+        # (lo, hi) of each monthly series over all scenarios and months.
+        # Profit is convex in the month, so its minimum sits at month 0,
+        # either side of the lead time or at the end of the term.
+        last = self.max_num_periods()
+        n = self.number_of_periods()
+        L = self.lead_time_in_months()
+        total_repayed = self.calculate_amounts_repayed_at(n)
+        final_revenue = self.calculate_cumulative_revenues_at(last)
+        owing_at_term = self.calculate_amounts_owing_at(n)
+
+        profit_lows = [
+            self.calculate_cumulative_profits_at(np.clip(m, 0, last))
+            for m in (np.floor(L), np.ceil(L), n, last)
+        ]
+        final_profit = self.calculate_cumulative_profits_at(last)
+        return {
+            'amount_repayed': (
+                min(0, np.min(total_repayed)), max(0, np.max(total_repayed))
+            ),
+            'amount_owing': (
+                min(0, np.min(owing_at_term)), max(0, np.max(self.principle))
+            ),
+            'cumulative_revenue': (
+                min(0, np.min(final_revenue)), max(0, np.max(final_revenue))
+            ),
+            'cumulative_profit': (
+                min(0, np.min(profit_lows)), max(0, np.max(final_profit))
+            )
+        }
+
+    def summary_figures(self):
+        # Closed forms of ScenarioTestResults.summary_figures(), one value
+        # per scenario and no monthly matrices.
+        last = self.max_num_periods()
+        final_profit = self.calculate_cumulative_profits_at(last)
+        final_revenue = self.calculate_cumulative_revenues_at(last)
+        return {
+            'interest_rate': self.annual_interest_rate,
+            'total_cost': self.calculate_amounts_owing_at(0),
+            'monthly_repayment': self.calculate_amounts_repayed_at(1),
+            'monthly_revenue':
+                final_revenue - self.calculate_cumulative_revenues_at(last - 1),
+            'monthly_profit':
+                final_profit - self.calculate_cumulative_profits_at(last - 1),
+            'total_profit': final_profit,
+            'annual_rate_of_return': self.calculate_annual_rates_of_return()
+        }
+
+    def months(self):
+        return np.arange(self.max_num_periods() + 1, dtype='float64')[None, :]
+
+    def montly_interest(self):
+        return self.annual_interest_rate / 12
+
+    def montly_revenue(self):
+        return self.annual_revenue / 12
+
+    def number_of_periods(self):
+        return self.loan_term_in_years * 12
+
+    def lead_time_in_months(self):
+        return self.lead_time_in_years * 12
+
+    def max_num_periods(self):
+        return int(self.max_loan_term * 12)
+
+    def labels(self):
+        return ScenarioLabels({
+            'principle': self.principle,
+            'loan_term': self.loan_term_in_years,
+            'interest_rate': self.annual_interest_rate,
+            'interest_only': self.interest_only,
+            'lead_time': self.lead_time_in_years,
+            'revenue': self.revenue_unit,
+            'annual_rate_of_return': self.calculate_annual_rates_of_return()
+        })
+
+
+class ScenarioLabels(object):
+    # Columnar table of scenario parameters, one array per key. It also
+    # reads as a sequence of dicts, so labels[i] behaves like
+    # Scenario.label() without a dict per scenario.
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_dicts(cls, labels):
+        keys = labels[0].keys() if len(labels) > 0 else []
+        return cls({k: np.array([l[k] for l in labels]) for k in keys})
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, i):
+        return {k: v[i].item() for k, v in self.columns.items()}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def column(self, k):
+        return self.columns[k]
+
+    def take(self, rows):
+        return ScenarioLabels({k: v[rows] for k, v in self.columns.items()})
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.columns)
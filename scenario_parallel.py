@@ -0,0 +1,103 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .scenario_grid import series_names
+from .scenario_testing import GridScenarioTester, ScenarioTestResults
+
+
+# Per-process state for pool workers, set up once by init_worker.
+worker_state = {}
+
+
+class ParallelScenarioTester(object):
+    # Splits a ScenarioCollection (or ScenarioGrid) over a process pool.
+    # Workers write their rows straight into shared memory matrices, so
+    # nothing but (start, stop) pairs crosses the process boundary, and
+    # the results are views of those same matrices rather than copies.
+    def __init__(self, name, source, processes=None, chunk_size=10000):
+        self.name = name
+        self.source = source
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def test(self):
+        grid = self.source.chunk(0, self.source.num_scenarios())
+        shape = (grid.num_scenarios(), grid.max_num_periods() + 1)
+
+        blocks = [
+            shared_memory.SharedMemory(
+                create=True, size=max(int(np.prod(shape)) * 8, 1)
+            )
+            for _ in series_names
+        ]
+        # The names are unlinked once the workers are done; the memory
+        # stays mapped here until the last array viewing it is freed.
+        try:
+            self.run_pool([b.name for b in blocks], shape)
+        except BaseException:
+            for b in blocks:
+                b.close()
+            raise
+        finally:
+            for b in blocks:
+                b.unlink()
+        series = [np.asarray(SharedSeries(b, shape)) for b in blocks]
+
+        amount_repayed, amount_owing, cumulative_revenue, cumulative_profit = \
+            series
+        return ScenarioTestResults(
+            self.name,
+            grid.annual_interest_rate,
+            amount_repayed, amount_owing,
+            cumulative_revenue, cumulative_profit,
+            grid.calculate_annual_rates_of_return(),
+            grid.labels()
+        )
+
+    def run_pool(self, block_names, shape):
+        ranges = [
+            (start, min(start + self.chunk_size, shape[0]))
+            for start in range(0, shape[0], self.chunk_size)
+        ]
+        with multiprocessing.Pool(
+            self.processes,
+            initializer=init_worker,
+            initargs=(self.name, self.source, block_names, shape)
+        ) as pool:
+            pool.starmap(evaluate_range, ranges)
+
+
+class SharedSeries(object):
+    # Owner of one shared memory block, exposed through the array
+    # interface. numpy keeps it as the base of every array taken from it,
+    # so the block is closed only when the last of them is gone.
+    def __init__(self, block, shape):
+        self.block = block
+        self.array = shared_array(block, shape)
+        self.__array_interface__ = self.array.__array_interface__
+
+    def __del__(self):
+        # The view is dropped first, as a block can't close while exported.
+        self.array = None
+        self.block.close()
+
+
+def shared_array(block, shape):
+    return np.ndarray(shape, dtype='float64', buffer=block.buf)
+
+
+def init_worker(name, source, block_names, shape):
+    blocks = [shared_memory.SharedMemory(name=n) for n in block_names]
+    worker_state['name'] = name
+    worker_state['source'] = source
+    worker_state['blocks'] = blocks
+    worker_state['series'] = [shared_array(b, shape) for b in blocks]
+
+
+def evaluate_range(start, stop):
+    grid = worker_state['source'].chunk(start, stop)
+    results = GridScenarioTester(worker_state['name'], grid).test()
+    for k, out in zip(series_names, worker_state['series']):
+        out[start:stop] = getattr(results, k)
@@ -0,0 +1,236 @@
+import numpy as np
+
+
+class PathScenarioGrid(object):
+    # A ScenarioGrid with monthly schedules in place of its fixed rate and
+    # flat revenue, for variable rate loans and revenue that ramps up or
+    # escalates. Each schedule is a table of paths over months 1..H, where
+    # H is grid.max_num_periods(), and a row of the table per scenario:
+    #
+    # rate_paths      the annual interest rate charged in each month.
+    # revenue_ramps   the fraction of full revenue earned in the 1st, 2nd,
+    #                 ... month after the lead time; 1 past its end.
+    # revenue_indices a multiplier on revenue in each month, such as an
+    #                 escalation_index().
+    #
+    # A schedule is one path shared by every scenario or one path per
+    # scenario. Alternatively path_index gives each scenario a row in every
+    # schedule of more than one path, as cross() does, so a few paths serve
+    # a large sweep without a copy per scenario. Paths shorter than H hold
+    # their last value, ramps end at 1.
+    # It has the parts of ScenarioGrid that GridScenarioTester uses, so
+    # GridScenarioTester(name, paths).test() gives the monthly results.
+    def __init__(self, grid,
+                 rate_paths=None, revenue_ramps=None, revenue_indices=None,
+                 path_index=None):
+        self.grid = grid
+        self.name = grid.name
+        self.path_index = path_index
+        n = grid.num_scenarios()
+        horizon = grid.max_num_periods()
+
+        if rate_paths is None:
+            self.rate_paths = grid.annual_interest_rate[:, None]
+            self.rate_rows = np.arange(n)
+        else:
+            self.rate_paths = fit_to_horizon(rate_paths, horizon)
+            self.rate_rows = schedule_rows(
+                self.rate_paths, path_index, n, 'rate_paths'
+            )
+        self.revenue_ramps = fit_to_horizon(
+            np.ones(1) if revenue_ramps is None else revenue_ramps,
+            horizon, fill=1.0
+        )
+        self.revenue_ramp_rows = schedule_rows(
+            self.revenue_ramps, path_index, n, 'revenue_ramps'
+        )
+        self.revenue_indices = fit_to_horizon(
+            np.ones(1) if revenue_indices is None else revenue_indices,
+            horizon
+        )
+        self.revenue_index_rows = schedule_rows(
+            self.revenue_indices, path_index, n, 'revenue_indices'
+        )
+
+        # The rate a scenario starts on stands in for its fixed rate in
+        # the results' interest_rate and labels.
+        self.annual_interest_rate = self.rate_paths[self.rate_rows, 0]
+        self.max_loan_term = grid.max_loan_term
+        self.balances_and_payments = None
+
+    @classmethod
+    def cross(cls, grid, rate_paths, revenue_ramps=None, revenue_indices=None):
+        # Every scenario of grid under each of the rate paths in turn, the
+        # paths varying fastest, as one more sweep axis. Ramps and indices
+        # are shared or, like rate_paths, one per path.
+        k = len(np.atleast_2d(rate_paths))
+        n = grid.num_scenarios()
+        return cls(
+            grid.take(np.repeat(np.arange(n), k)),
+            rate_paths, revenue_ramps, revenue_indices,
+            path_index=np.tile(np.arange(k), n)
+        )
+
+    def num_scenarios(self):
+        return self.grid.num_scenarios()
+
+    def max_num_periods(self):
+        return self.grid.max_num_periods()
+
+    def chunk(self, start, stop):
+        return self.take(slice(start, stop))
+
+    def take(self, rows):
+        paths = PathScenarioGrid.__new__(PathScenarioGrid)
+        paths.__dict__.update(self.__dict__)
+        paths.grid = self.grid.take(rows)
+        paths.rate_rows = self.rate_rows[rows]
+        paths.revenue_ramp_rows = self.revenue_ramp_rows[rows]
+        paths.revenue_index_rows = self.revenue_index_rows[rows]
+        paths.annual_interest_rate = self.annual_interest_rate[rows]
+        paths.balances_and_payments = None
+        if self.path_index is not None:
+            paths.path_index = self.path_index[rows]
+        return paths
+
+    def monthly_rates(self):
+        # (scenarios, H) monthly interest rates, month 1 first.
+        rates = self.rate_paths[self.rate_rows] / 12
+        return np.broadcast_to(rates, (len(rates), self.max_num_periods()))
+
+    def calculate_balances_and_payments(self):
+        # The loan as a recurrence over months m = 1..H. Each month the
+        # payment is re-set to amortise the balance over the rest of the
+        # term at that month's rate r_m, as a variable rate loan reprices:
+        #
+        #   a_m = r_m / (1 - (1 + r_m) ** -(n - m + 1))
+        #   c_m = a_m B_{m-1},   B_m = (1 + r_m - a_m) B_{m-1}
+        #
+        # so B_m = P cumprod(1 + r - a) and amounts repayed are cumsum(c).
+        # Interest only loans pay a_m = r_m and keep B_m = P. At a fixed
+        # rate a_m B_{m-1} is the same payment every month and the curves
+        # are ScenarioGrid's closed forms. A fractional term's last month
+        # pays its fraction of a payment, as in ScenarioGrid.
+        # Amounts repayed and owing both come from one run of the
+        # recurrence, kept until take() makes a grid of other rows.
+        if self.balances_and_payments is not None:
+            return self.balances_and_payments
+        g = self.grid
+        r = self.monthly_rates()
+        months = np.arange(1, g.max_num_periods() + 1, dtype='float64')
+        remaining = g.number_of_periods()[:, None] - months[None, :] + 1
+        k = np.where(remaining > 0, remaining, 1.0)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            a = np.where(r != 0, r / (1 - (1 + r) ** -k), 1 / k)
+        a = np.where(g.interest_only[:, None], r, a)
+
+        growth = np.where(remaining >= 1, 1 + r - a, 0.0)
+        balances = np.empty((g.num_scenarios(), len(months) + 1))
+        balances[:, 0] = g.principle
+        np.cumprod(growth, axis=1, out=balances[:, 1:])
+        balances[:, 1:] *= g.principle[:, None]
+
+        payments = balances[:, :-1] * a * np.clip(remaining, 0, 1)
+        self.balances_and_payments = balances, payments
+        return self.balances_and_payments
+
+    def calculate_amounts_repayed_by_month(self):
+        _, payments = self.calculate_balances_and_payments()
+        X = np.zeros((self.num_scenarios(), self.max_num_periods() + 1))
+        np.cumsum(payments, axis=1, out=X[:, 1:])
+        return X
+
+    def calculate_amounts_owing_by_month(self):
+        balances, _ = self.calculate_balances_and_payments()
+        months = np.arange(self.max_num_periods() + 1, dtype='float64')
+        active = months[None, :] <= self.grid.number_of_periods()[:, None]
+        return np.where(active, balances, 0.0)
+
+    def calculate_cumulative_revenues_by_month(self):
+        # Month m earns R ((m - L)+ - (m - 1 - L)+), the part of the month
+        # past the lead time, scaled by the ramp for which month of revenue
+        # it is and by the month's revenue index.
+        g = self.grid
+        horizon = g.max_num_periods()
+        months = np.arange(1, horizon + 1, dtype='float64')[None, :]
+        L = g.lead_time_in_months()[:, None]
+        earning = np.maximum(months - L, 0) - np.maximum(months - 1 - L, 0)
+
+        revenue_month = np.clip(np.ceil(months - L) - 1, 0, horizon - 1)
+        ramp = np.take_along_axis(
+            self.revenue_ramps[self.revenue_ramp_rows],
+            revenue_month.astype('int64'), axis=1
+        )
+        earning *= ramp
+        earning *= self.revenue_indices[self.revenue_index_rows]
+        earning *= g.montly_revenue()[:, None]
+
+        X = np.zeros((self.num_scenarios(), horizon + 1))
+        np.cumsum(earning, axis=1, out=X[:, 1:])
+        return X
+
+    def calculate_annual_rates_of_return(self):
+        return self.grid.calculate_annual_rates_of_return()
+
+    def labels(self):
+        labels = self.grid.labels()
+        labels.columns['interest_rate'] = self.annual_interest_rate
+        if self.path_index is not None:
+            labels.columns['path'] = self.path_index
+        return labels
+
+
+def fit_to_horizon(paths, horizon, fill=None):
+    # 2d table of paths exactly horizon months long. Short paths are
+    # extended with fill, or with their last value if fill is None.
+    paths = np.atleast_2d(np.asarray(paths, dtype='float64'))
+    if paths.shape[1] >= horizon:
+        return paths[:, :horizon]
+    if fill is None:
+        extension = np.repeat(paths[:, -1:], horizon - paths.shape[1], axis=1)
+    else:
+        extension = np.full((len(paths), horizon - paths.shape[1]), fill)
+    return np.concatenate((paths, extension), axis=1)
+
+
+def schedule_rows(paths, path_index, n, name):
+    # Row of paths for each of n scenarios.
+    if len(paths) == 1:
+        return np.zeros(n, dtype='int64')
+    if path_index is not None:
+        path_index = np.asarray(path_index, dtype='int64')
+        if path_index.shape != (n, ) or \
+                np.any((path_index < 0) | (path_index >= len(paths))):
+            raise ValueError(
+                'path_index needs a row of the %i %s for each scenario.'
+                % (len(paths), name)
+            )
+        return path_index
+    if len(paths) == n:
+        return np.arange(n)
+    raise ValueError(
+        '%s needs one path, or one per scenario (%i), not %i.'
+        % (name, n, len(paths))
+    )
+
+
+def yearly_path(annual_values, horizon):
+    # Monthly path holding each year's value for its twelve months, e.g.
+    # the rate of a loan repricing once a year; the last year's value
+    # carries on. One value per year, or a row of them per path.
+    values = np.atleast_2d(np.asarray(annual_values, dtype='float64'))
+    year = np.minimum(np.arange(horizon) // 12, values.shape[1] - 1)
+    return values[:, year]
+
+
+def escalation_index(annual_escalation, horizon):
+    # Revenue multiplier rising by annual_escalation at the start of each
+    # year, one row per escalation rate.
+    e = np.asarray(annual_escalation, dtype='float64').reshape(-1, 1)
+    return (1 + e) ** (np.arange(horizon) // 12)
+
+
+def linear_ramp(months):
+    # Revenue building up evenly to its full level over months.
+    return np.arange(1, months + 1, dtype='float64') / months
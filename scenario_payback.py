@@ -0,0 +1,26 @@
+import numpy as np
+
+
+class PaybackAnalyser(object):
+    # Per-scenario payback and revenue cover months for a ScenarioCollection
+    # (or ScenarioGrid), evaluated chunk by chunk without monthly matrices.
+    def __init__(self, source, chunk_size=1000000):
+        self.source = source
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        n = self.source.num_scenarios()
+        for start in range(0, n, self.chunk_size):
+            grid = self.source.chunk(start, start + self.chunk_size)
+            yield (
+                start,
+                grid.calculate_payback_months(),
+                grid.calculate_revenue_cover_months()
+            )
+
+    def calculate(self):
+        payback, cover = [], []
+        for _, p, c in self.chunks():
+            payback.append(p)
+            cover.append(c)
+        return np.concatenate(payback), np.concatenate(cover)
@@ -0,0 +1,179 @@
+import numpy as np
+
+from .scenario_grid import ScenarioGrid
+
+
+# (s, a, m) direction number parameters of Joe and Kuo's new-joe-kuo-6.21201
+# table for Sobol dimensions 2 to 8; dimension 1 is the van der Corput
+# sequence in base 2.
+sobol_parameters = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17])
+]
+
+sobol_bits = 32
+
+halton_bases = [2, 3, 5, 7, 11, 13, 17, 19]
+
+
+def random_points(n, d, rng):
+    return rng.random((n, d))
+
+
+def latin_hypercube_points(n, d, rng):
+    # One point in each of n equal strata of every dimension, with the
+    # strata paired up across dimensions by independent permutations.
+    strata = np.argsort(rng.random((n, d)), axis=0)
+    return (strata + rng.random((n, d))) / n
+
+
+def sobol_direction_numbers(d):
+    if d > len(sobol_parameters) + 1:
+        raise ValueError(
+            'Sobol sampling supports up to %i dimensions.'
+            % (len(sobol_parameters) + 1)
+        )
+    V = np.zeros((d, sobol_bits), dtype='uint64')
+    V[0] = [1 << (sobol_bits - 1 - k) for k in range(sobol_bits)]
+    for j, (s, a, m) in enumerate(sobol_parameters[:d - 1], start=1):
+        v = [m_k << (sobol_bits - 1 - k) for k, m_k in enumerate(m)]
+        for k in range(s, sobol_bits):
+            x = v[k - s] ^ (v[k - s] >> s)
+            for i in range(1, s):
+                if (a >> (s - 1 - i)) & 1:
+                    x ^= v[k - i]
+            v.append(x)
+        V[j] = v
+    return V
+
+
+def sobol_points(n, d, rng):
+    # Point i is the XOR of the direction numbers picked out by the bits of
+    # i's Gray code. With a seed, a random digital shift scrambles the
+    # sequence while keeping its stratification.
+    V = sobol_direction_numbers(d)
+    gray = np.arange(n, dtype='uint64')
+    gray ^= gray >> np.uint64(1)
+    X = np.zeros((n, d), dtype='uint64')
+    for b in range(sobol_bits):
+        bit = (gray >> np.uint64(b)) & np.uint64(1)
+        X ^= bit[:, None] * V[:, b][None, :]
+    if rng is not None:
+        X ^= rng.integers(0, 1 << sobol_bits, size=d, dtype='uint64')
+    return X / float(1 << sobol_bits)
+
+
+def halton_points(n, d, rng):
+    # Radical inverse of 1..n in the first d primes; with a seed, each
+    # dimension gets a random Cranley-Patterson shift.
+    if d > len(halton_bases):
+        raise ValueError(
+            'Halton sampling supports up to %i dimensions.' % len(halton_bases)
+        )
+    X = np.zeros((n, d))
+    for j, base in enumerate(halton_bases[:d]):
+        i = np.arange(1, n + 1)
+        f = 1.0
+        while np.any(i > 0):
+            f /= base
+            X[:, j] += f * (i % base)
+            i //= base
+    if rng is not None:
+        X = (X + rng.random(d)) % 1.0
+    return X
+
+
+sampling_methods = {
+    'random': random_points,
+    'lhs': latin_hypercube_points,
+    'sobol': sobol_points,
+    'halton': halton_points
+}
+
+
+class Range(object):
+    # A parameter sampled continuously over [lo, hi]. Any other sequence,
+    # list or tuple, is a set of values to choose between.
+    def __init__(self, lo, hi):
+        if not lo <= hi:
+            raise ValueError('Range needs lo <= hi, got (%s, %s).' % (lo, hi))
+        self.lo = lo
+        self.hi = hi
+
+    def __repr__(self):
+        return 'Range(%r, %r)' % (self.lo, self.hi)
+
+
+class ScenarioSampler(object):
+    # Draws a fixed budget of scenarios instead of the full factorial grid.
+    # Each parameter is a Range, sampled continuously, or a list or tuple
+    # of values to choose between, as in ScenarioCollection. interest_only
+    # is a choice of flags and cannot be a Range.
+    def __init__(self,
+                 name,
+                 principles, annual_interest_rates,
+                 interest_only, loan_terms_in_years,
+                 lead_times_in_years, revenue_units,
+                 annual_revenue_factor):
+        self.name = name
+        self.principles = principles
+        self.annual_interest_rates = annual_interest_rates
+        self.interest_only = interest_only
+        self.loan_terms_in_years = loan_terms_in_years
+        self.lead_times_in_years = lead_times_in_years
+        self.revenue_units = revenue_units
+        self.annual_revenue_factor = annual_revenue_factor
+        if isinstance(interest_only, Range):
+            raise ValueError(
+                'interest_only is boolean; give the flags to choose between, '
+                'e.g. [False, True], not a Range.'
+            )
+
+    def axes(self):
+        return (
+            self.principles,
+            self.annual_interest_rates,
+            self.interest_only,
+            self.loan_terms_in_years,
+            self.lead_times_in_years,
+            self.revenue_units
+        )
+
+    def sample(self, n, method='lhs', seed=None):
+        if method not in sampling_methods:
+            raise ValueError(
+                'Unknown sampling method %s, expected one of %s.'
+                % (method, ', '.join(sorted(sampling_methods)))
+            )
+        rng = np.random.default_rng(seed)
+        if method in ('sobol', 'halton') and seed is None:
+            rng = None
+        U = sampling_methods[method](n, len(self.axes()), rng)
+
+        p, ir, io, lt, ld, ru = [
+            scale_to_axis(U[:, j], axis) for j, axis in enumerate(self.axes())
+        ]
+        return ScenarioGrid(
+            self.name,
+            p, ir, io, lt, ld, ru,
+            self.annual_revenue_factor, self.max_loan_length()
+        )
+
+    def max_loan_length(self):
+        terms = self.loan_terms_in_years
+        if isinstance(terms, Range):
+            terms = [terms.hi]
+        return int(np.ceil(np.max(terms)))
+
+
+def scale_to_axis(u, axis):
+    if isinstance(axis, Range):
+        return axis.lo + u * (axis.hi - axis.lo)
+    values = np.asarray(axis)
+    i = np.minimum((u * len(values)).astype('int64'), len(values) - 1)
+    return values[i]
@@ -0,0 +1,179 @@
+import numpy as np
+
+from .scenario_grid import ScenarioGrid
+
+
+sensitivity_parameters = [
+    'principle',
+    'annual_interest_rate',
+    'loan_term_in_years',
+    'lead_time_in_years',
+    'revenue_unit'
+]
+
+
+def final_profits(grid):
+    return grid.calculate_cumulative_profits_at(grid.max_num_periods())
+
+
+def payback_months(grid):
+    months = grid.calculate_payback_months()
+    return np.where(months < 0, np.inf, months)
+
+
+sensitivity_metrics = {
+    'total_profit': final_profits,
+    'payback_month': payback_months,
+    'annual_rate_of_return': lambda grid: grid.calculate_annual_rates_of_return()
+}
+
+
+class SensitivityAnalyser(object):
+    # One-at-a-time sensitivity of every scenario in a grid. ranges maps a
+    # parameter to its (low, high) perturbation, as fractions of the base
+    # value when relative is set and as absolute offsets otherwise; step is
+    # the relative step of the central differences behind elasticities.
+    # All perturbed cases go through the closed forms as one batch at the
+    # grid's own horizon, so the base matches the grid's summaries. A loan
+    # term raised past that horizon would lose its later repayments, so
+    # term perturbations are then taken, with a base of their own, over a
+    # horizon covering the longest perturbed term; see SensitivityResults.
+    def __init__(self, grid, ranges=None, relative=True, step=0.01):
+        if ranges is None:
+            ranges = {k: (-0.1, 0.1) for k in sensitivity_parameters}
+        self.grid = grid
+        self.ranges = ranges
+        self.relative = relative
+        self.step = step
+
+    def analyse(self):
+        # Batch rows: the base case, then (low, high) for each parameter,
+        # then (down, up) central difference steps for each parameter.
+        parameters = list(self.ranges)
+        perturbations = [(None, 0, False)]
+        for k in parameters:
+            low, high = self.ranges[k]
+            perturbations += [(k, low, self.relative), (k, high, self.relative)]
+        for k in parameters:
+            perturbations += [(k, -self.step, True), (k, self.step, True)]
+
+        horizon = self.grid.max_num_periods()
+        term_horizon = self.term_horizon(perturbations)
+        batch = self.perturbed_grid(perturbations, horizon)
+        term_rows = [
+            i for i, (k, _, _) in enumerate(perturbations)
+            if k == 'loan_term_in_years'
+        ]
+        if term_horizon > horizon:
+            term_batch = self.perturbed_grid(
+                [perturbations[0]] + [perturbations[i] for i in term_rows],
+                term_horizon
+            )
+
+        n, m = self.grid.num_scenarios(), len(parameters)
+        results = {}
+        for metric, fn in sensitivity_metrics.items():
+            values = fn(batch).reshape(len(perturbations), n)
+            base = values[0]
+            # Each parameter's differences are taken against the base at
+            # the horizon its rows were evaluated to.
+            bases = np.repeat(base[:, None], m, axis=1)
+            if term_horizon > horizon:
+                term_values = fn(term_batch).reshape(len(term_rows) + 1, n)
+                values[term_rows] = term_values[1:]
+                bases[:, parameters.index('loan_term_in_years')] = \
+                    term_values[0]
+            low, high = values[1:1 + 2 * m:2].T, values[2:1 + 2 * m:2].T
+            down, up = values[1 + 2 * m::2].T, values[2 + 2 * m::2].T
+            with np.errstate(divide='ignore', invalid='ignore'):
+                elasticity = (up - down) / (2 * self.step * bases)
+            results[metric] = {
+                'base': base, 'bases': bases, 'low': low, 'high': high,
+                'elasticity': elasticity
+            }
+        return SensitivityResults(
+            self.grid, parameters, self.ranges, results, term_horizon
+        )
+
+    def term_horizon(self, perturbations):
+        # Months needed to see every perturbed loan term to its end.
+        g = self.grid
+        longest = g.max_num_periods()
+        for k, offset, relative in perturbations:
+            if k == 'loan_term_in_years':
+                terms = g.loan_term_in_years * (1 + offset) if relative \
+                    else g.loan_term_in_years + offset
+                longest = max(longest, int(np.ceil(np.max(terms) * 12)))
+        return longest
+
+    def perturbed_grid(self, perturbations, horizon):
+        # One copy of the grid per perturbation, each with a single
+        # parameter moved, all run to horizon months.
+        g = self.grid
+        n = g.num_scenarios()
+        fields = {
+            k: np.concatenate([getattr(g, k)] * len(perturbations))
+            for k in [
+                'principle', 'annual_interest_rate', 'interest_only',
+                'loan_term_in_years', 'lead_time_in_years',
+                'revenue_unit', 'annual_revenue_factor'
+            ]
+        }
+        for i, (k, offset, relative) in enumerate(perturbations):
+            if k is None:
+                continue
+            rows = slice(i * n, (i + 1) * n)
+            base = getattr(g, k)
+            fields[k][rows] = base * (1 + offset) if relative else base + offset
+        max_loan_term = g.max_loan_term
+        if horizon != g.max_num_periods():
+            # Half a month over, so max_num_periods() rounds down to horizon.
+            max_loan_term = (horizon + 0.5) / 12
+        return ScenarioGrid(g.name, max_loan_term=max_loan_term, **fields)
+
+
+class SensitivityResults(object):
+    # base is every metric at the grid's own horizon. When a perturbed
+    # term runs past it, the loan term's low, high and elasticity are taken
+    # at term_horizon months instead, against that horizon's base in
+    # bases; term_extended() says whether they were.
+    def __init__(self, grid, parameters, ranges, results, term_horizon):
+        self.grid = grid
+        self.parameters = parameters
+        self.ranges = ranges
+        self.results = results
+        self.term_horizon = term_horizon
+
+    def term_extended(self):
+        return self.term_horizon > self.grid.max_num_periods()
+
+    def base(self, metric):
+        return self.results[metric]['base']
+
+    def elasticities(self, metric):
+        # (n_scenarios, n_parameters) relative change in the metric per
+        # relative change in each parameter.
+        return self.results[metric]['elasticity']
+
+    def tornado(self, metric='total_profit', scenario=0):
+        # (parameter, value at low, value at high) for one scenario, the
+        # widest swing first. A loan term taken over a longer horizon is
+        # drawn as its change from that horizon's base, about the base at
+        # the grid's horizon, and its name says which month it ran to.
+        r = self.results[metric]
+        bars = []
+        for j, k in enumerate(self.parameters):
+            shift = r['base'][scenario] - r['bases'][scenario, j]
+            low, high = r['low'][scenario, j], r['high'][scenario, j]
+            if k == 'loan_term_in_years' and self.term_extended():
+                k = '%s (to month %i)' % (k, self.term_horizon)
+                low, high = low + shift, high + shift
+            bars.append((k, low, high))
+        return sorted(bars, key=lambda b: -abs(b[2] - b[1]))
+
+    def plot_tornado(self, file_name, metric='total_profit', scenario=0):
+        from .results_plotter import TornadoPlotter
+        TornadoPlotter(
+            self.grid.name, metric, self.base(metric)[scenario],
+            self.tornado(metric, scenario)
+        ).plot_and_savefig(file_name)
@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .scenario_grid import series_names
+from .scenario_testing import (
+    ClosedFormSummariser, GridScenarioTester, ScenarioCollection
+)
+
+
+sweep_axes = [
+    'principles', 'annual_interest_rates', 'interest_only',
+    'loan_terms_in_years', 'lead_times_in_years', 'revenue_units'
+]
+
+max_slice_rows = 10000
+
+http_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    pass
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.message = message
+
+
+def collection_from_sweep(sweep):
+    # A sweep is ScenarioCollection's arguments as JSON: 'name', one list
+    # per axis in sweep_axes and 'annual_revenue_factor'.
+    expected = set(sweep_axes) | {'name', 'annual_revenue_factor'}
+    missing = expected - set(sweep)
+    if missing:
+        raise RequestError('Sweep is missing %s.' % ', '.join(sorted(missing)))
+    for k in sweep_axes:
+        if not isinstance(sweep[k], list) or len(sweep[k]) == 0:
+            raise RequestError('Sweep axis %s must be a non-empty list.' % k)
+        valid = is_flag if k == 'interest_only' else is_number
+        if not all(valid(v) for v in sweep[k]):
+            raise RequestError('Sweep axis %s must hold only %s.' % (
+                k, 'booleans' if k == 'interest_only' else 'finite numbers'
+            ))
+    if not is_number(sweep['annual_revenue_factor']):
+        raise RequestError('annual_revenue_factor must be a finite number.')
+    return ScenarioCollection(
+        str(sweep['name']),
+        *[sweep[k] for k in sweep_axes],
+        float(sweep['annual_revenue_factor']),
+        build_scenarios=False
+    )
+
+
+def is_number(x):
+    # A JSON number; JSON booleans decode to bool, a subclass of int.
+    return isinstance(x, (int, float)) and not isinstance(x, bool) \
+        and math.isfinite(x)
+
+
+def is_flag(x):
+    return isinstance(x, bool)
+
+
+def evaluate_summary(sweep):
+    # Runs in a pool worker: summarise()'s figures from the closed forms.
+    collection = collection_from_sweep(sweep)
+    summary = ClosedFormSummariser(collection.name, collection).summary()
+    return json_safe({
+        'name': summary.name,
+        'num_scenarios': collection.num_scenarios(),
+        'ranges': {
+            k: [float(lo), float(hi)] for k, (lo, hi) in summary.ranges.items()
+        },
+        'best': summary.best_label,
+        'worst': summary.worst_label,
+        'lines': summary.summary_lines()
+    })
+
+
+def evaluate_slice(sweep, start, stop, series):
+    # Runs in a pool worker: monthly series of scenarios [start, stop).
+    collection = collection_from_sweep(sweep)
+    grid = collection.chunk(start, stop)
+    results = GridScenarioTester(collection.name, grid).test(metrics=series)
+    return {
+        'name': collection.name,
+        'start': start,
+        'stop': start + grid.num_scenarios(),
+        'labels': json_safe(list(results.labels)),
+        'series': {k: finite_list(getattr(results, k)) for k in series}
+    }
+
+
+def slice_arguments(request):
+    try:
+        start = int(request.get('start', 0))
+        stop = int(request.get('stop', start + 100))
+    except (TypeError, ValueError):
+        raise RequestError('start and stop must be integers.')
+    if not 0 <= start <= stop or stop - start > max_slice_rows:
+        raise RequestError(
+            'Need 0 <= start <= stop and at most %i rows.' % max_slice_rows
+        )
+    series = request.get('series', ['cumulative_profit'])
+    if isinstance(series, str):
+        series = [series]
+    if not isinstance(series, list) or \
+            not all(isinstance(k, str) for k in series):
+        raise RequestError('series must be a name or a list of names.')
+    unknown = set(series) - set(series_names)
+    if unknown:
+        raise RequestError('Unknown series %s.' % sorted(unknown))
+    return start, stop, sorted(series, key=series_names.index)
+
+
+class ScenarioService(object):
+    # Local HTTP service around the scenario engine, on TCP or a Unix
+    # socket. POST /summary and POST /slice take a sweep as JSON and
+    # return JSON. Evaluations run on a process pool; identical requests
+    # in flight share one evaluation and the last cache_entries answers
+    # are kept.
+    def __init__(self, processes=None, cache_entries=128):
+        self.processes = processes
+        self.cache_entries = cache_entries
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.pool = None
+        self.stats = {'requests': 0, 'evaluations': 0,
+                      'cache_hits': 0, 'coalesced': 0}
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        # Workers are spawned rather than forked: a forked worker would
+        # inherit the open client sockets and hold their connections open.
+        self.pool = ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn')
+        )
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        server = await self.start(host, port, path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    async def evaluate(self, key, fn, *args):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return self.cache[key]
+        if key in self.in_flight:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, fn, *args)
+        self.in_flight[key] = future
+        self.stats['evaluations'] += 1
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            del self.in_flight[key]
+
+        self.cache[key] = result
+        while len(self.cache) > self.cache_entries:
+            self.cache.popitem(last=False)
+        return result
+
+    async def route(self, method, path, request):
+        if path == '/health':
+            return dict(self.stats, cached=len(self.cache))
+        if method != 'POST':
+            raise HTTPError(405, 'Use POST for %s.' % path)
+
+        sweep = request.get('sweep')
+        if not isinstance(sweep, dict):
+            raise RequestError('Request needs a sweep object.')
+        sweep_key = json.dumps(sweep, sort_keys=True)
+        collection_from_sweep(sweep)
+
+        if path == '/summary':
+            return await self.evaluate(
+                ('summary', sweep_key), evaluate_summary, sweep
+            )
+        if path == '/slice':
+            start, stop, series = slice_arguments(request)
+            return await self.evaluate(
+                ('slice', sweep_key, start, stop, tuple(series)),
+                evaluate_slice, sweep, start, stop, series
+            )
+        raise HTTPError(404, 'No endpoint %s.' % path)
+
+    async def handle(self, reader, writer):
+        self.stats['requests'] += 1
+        try:
+            method, path, body = await read_request(reader)
+            request = parse_body(body)
+            status, answer = 200, await self.route(method, path, request)
+        except HTTPError as e:
+            status, answer = e.status, {'error': e.message}
+        except RequestError as e:
+            status, answer = 400, {'error': str(e)}
+        except Exception as e:
+            status, answer = 500, {'error': '%s: %s' % (type(e).__name__, e)}
+        try:
+            await write_response(writer, status, answer)
+        finally:
+            writer.close()
+
+
+def parse_body(body):
+    # Bad input is a RequestError; any other exception is a server fault.
+    try:
+        request = json.loads(body) if body else {}
+    except ValueError as e:
+        raise RequestError('Request body is not valid JSON: %s' % e)
+    if not isinstance(request, dict):
+        raise RequestError('Request body must be a JSON object.')
+    return request
+
+
+async def read_request(reader):
+    # One HTTP/1.1 request per connection; only Content-Length bodies.
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        raise RequestError('Incomplete HTTP request.')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise RequestError('Bad request line.')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError('Bad Content-Length.')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), path.split('?', 1)[0], body
+
+
+async def write_response(writer, status, answer):
+    # Answers are made JSON safe where they are built; a non-finite value
+    # that slips through is an error rather than an invalid NaN token.
+    try:
+        body = json.dumps(answer, allow_nan=False).encode()
+    except ValueError as e:
+        status = 500
+        body = json.dumps({'error': str(e)}).encode()
+    writer.write((
+        'HTTP/1.1 %i %s\r\n'
+        'Content-Type: application/json\r\n'
+        'Content-Length: %i\r\n'
+        'Connection: close\r\n\r\n'
+        % (status, http_reasons.get(status, ''), len(body))
+    ).encode('latin-1') + body)
+    await writer.drain()
+
+
+def json_safe(x):
+    # JSON has no NaN or infinity, so non-finite numbers are sent as null.
+    if isinstance(x, dict):
+        return {k: json_safe(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [json_safe(v) for v in x]
+    if isinstance(x, np.ndarray):
+        return finite_list(x)
+    if isinstance(x, np.generic):
+        x = x.item()
+    if isinstance(x, float) and not math.isfinite(x):
+        return None
+    return x
+
+
+def finite_list(X):
+    # X.tolist() with non-finite values as None, checked for all of X at
+    # once so large slices are not walked element by element.
+    finite = np.isfinite(X)
+    if finite.all():
+        return X.tolist()
+    return np.where(finite, X, None).tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Local scenario evaluation service.'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None,
+                        help='listen on this Unix socket path instead')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--cache-entries', type=int, default=128)
+    args = parser.parse_args(argv)
+
+    service = ScenarioService(args.processes, args.cache_entries)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
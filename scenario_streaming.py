@@ -0,0 +1,119 @@
+import numpy as np
+
+from .scenario_bands import MonthlyDensity
+from .scenario_grid import merge_ranges, series_names, value_ranges
+from .scenario_testing import GridScenarioTester, ScenarioSummary
+
+
+class StreamingScenarioTester(object):
+    # Evaluates a ScenarioCollection (or ScenarioGrid) chunk_size scenarios
+    # at a time, so peak memory is set by the chunk size, not the sweep.
+    # With bins set, per-month densities are also kept for band plots.
+    def __init__(self, name, source, chunk_size=10000, bins=None):
+        self.name = name
+        self.source = source
+        self.chunk_size = chunk_size
+        self.bins = bins
+
+    def chunks(self):
+        n = self.source.num_scenarios()
+        for start in range(0, n, self.chunk_size):
+            grid = self.source.chunk(start, start + self.chunk_size)
+            yield start, GridScenarioTester(self.name, grid).test()
+
+    def test(self):
+        reduction = StreamingReduction(self.name)
+        if self.bins:
+            reduction.density = MonthlyDensity.from_source(
+                self.source, bins=self.bins
+            )
+        for start, results in self.chunks():
+            reduction.update(start, results)
+        return reduction
+
+
+class StreamingReduction(object):
+    def __init__(self, name):
+        self.name = name
+        self.num_scenarios = 0
+        self.ranges = {}
+        self.envelopes = {}
+        self.best_index = None
+        self.worst_index = None
+        self.best_profit = None
+        self.worst_profit = None
+        self.best_label = None
+        self.worst_label = None
+        self.density = None
+
+    def update(self, start, results):
+        self.num_scenarios += len(results.cumulative_profit)
+        self.update_ranges(results.summary_figures())
+        self.update_envelopes(results)
+        self.update_best_and_worst(start, results)
+        if self.density is not None:
+            self.density.add(results)
+
+    def update_ranges(self, figures):
+        merge_ranges(self.ranges, value_ranges(figures))
+
+    def update_envelopes(self, results):
+        for k in series_names:
+            series = getattr(results, k)
+            Y_min = np.min(series, axis=0)
+            Y_max = np.max(series, axis=0)
+            if k in self.envelopes:
+                old_min, old_max = self.envelopes[k]
+                Y_min = np.minimum(old_min, Y_min)
+                Y_max = np.maximum(old_max, Y_max)
+            self.envelopes[k] = (Y_min, Y_max)
+
+    def update_best_and_worst(self, start, results):
+        best_i, worst_i = results.best_and_worst_index()
+        final_profit = results.cumulative_profit[:, -1]
+
+        if self.best_profit is None or final_profit[best_i] > self.best_profit:
+            self.best_profit = final_profit[best_i]
+            self.best_index = start + best_i
+            self.best_label = results.labels[best_i]
+        if self.worst_profit is None or final_profit[worst_i] < self.worst_profit:
+            self.worst_profit = final_profit[worst_i]
+            self.worst_index = start + worst_i
+            self.worst_label = results.labels[worst_i]
+
+    def summary(self):
+        return ScenarioSummary(
+            self.name, self.ranges, self.best_label, self.worst_label
+        )
+
+    def summarise(self):
+        self.summary().summarise()
+
+    def envelope_series(self, k):
+        return np.vstack(self.envelopes[k])
+
+    def plot(self, file_name, mode='envelope'):
+        from .results_plotter import DensityPlotter, ResultsPlotter
+
+        if mode != 'envelope':
+            if self.density is None:
+                raise RuntimeError(
+                    'Plot mode %s needs a tester created with bins set.' % mode
+                )
+            DensityPlotter(
+                self.name, self.density,
+                self.best_label, self.worst_label, mode
+            ).plot_and_savefig(file_name)
+            return
+
+        # Row 0 is the lower and row 1 the upper envelope, so the plotter's
+        # best/worst lookup on the final profit lands on the matching label.
+        plotter = ResultsPlotter(
+            self.name,
+            self.envelope_series('amount_repayed'),
+            self.envelope_series('amount_owing'),
+            self.envelope_series('cumulative_revenue'),
+            self.envelope_series('cumulative_profit'),
+            [self.worst_label, self.best_label]
+        )
+        plotter.plot_and_savefig(file_name)
@@ -1,7 +1,15 @@
 import itertools
+import json
+import os
+
 import numpy as np
 
-from .results_plotter import ResultsPlotter
+from .instrumentation import run_stage, stage
+from .scenario_bands import MonthlyDensity
+from .scenario_grid import (
+    ScenarioGrid, ScenarioLabels, amortised_repayments, merge_ranges,
+    repayment_growth, series_names, value_ranges
+)
 
 
 class Scenario(object):
@@ -28,7 +36,7 @@ class Scenario(object):
         if self.interest_only:
             c = r * p
         elif not self.interest_only:
-            c = r * p / (1 - (1 + r) ** -n)
+            c = amortised_repayments(r, p, n)
         return c
 
     def calculate_amount_repayed_by_month(self):
@@ -44,7 +52,7 @@ class Scenario(object):
         N = self.cumulative_periods_vector()
         c = self.calculate_repayment_amount()
 
-        P_f = P * ((1 + r) ** N) - c * (((1 + r) ** N - 1) / r)
+        P_f = P * ((1 + r) ** N) - c * repayment_growth((1 + r) ** N, r, N)
         return P_f
 
     def calculate_cumulative_revenue_by_month(self):
@@ -103,7 +111,8 @@ class ScenarioCollection(object):
                  principles, annual_interest_rates,
                  interest_only, loan_terms_in_years,
                  lead_times_in_years, revenue_units,
-                 annual_revenue_factor):
+                 annual_revenue_factor,
+                 build_scenarios=True):
         self.name = name
         self.principles = principles
         self.annual_interest_rates = annual_interest_rates
@@ -113,10 +122,19 @@ class ScenarioCollection(object):
         self.revenue_units = revenue_units
         self.annual_revenue_factor = annual_revenue_factor
 
-        self.scenarios = self.combine()
+        if build_scenarios:
+            self.scenarios = self.combine()
 
     def combine(self):
-        scenarios = [
+        with stage('ScenarioCollection.combine') as s:
+            scenarios = self.build_scenarios()
+            s.info(n_scenarios=len(scenarios))
+
+        print('Created %i scenarios.' % len(scenarios))
+        return scenarios
+
+    def build_scenarios(self):
+        return [
             Scenario(
                 self.name,
                 p, ir, io, lt, ld, ru,
@@ -132,34 +150,91 @@ class ScenarioCollection(object):
             )
         ]
 
-        print('Created %i scenarios.' % len(scenarios))
-        return scenarios
-
     def max_loan_length(self):
         return max(self.loan_terms_in_years)
 
+    def axes(self):
+        return (
+            self.principles,
+            self.annual_interest_rates,
+            self.interest_only,
+            self.loan_terms_in_years,
+            self.lead_times_in_years,
+            self.revenue_units
+        )
+
+    def shape(self):
+        return tuple(len(a) for a in self.axes())
+
+    def num_scenarios(self):
+        return int(np.prod(self.shape()))
+
+    def grid(self):
+        return self.chunk(0, self.num_scenarios())
+
+    def chunk(self, start, stop):
+        # Scenarios in [start, stop) of the itertools.product ordering.
+        flat = np.arange(start, min(stop, self.num_scenarios()))
+        indices = np.unravel_index(flat, self.shape())
+        p, ir, io, lt, ld, ru = [
+            np.asarray(axis)[i] for axis, i in zip(self.axes(), indices)
+        ]
+        return ScenarioGrid(
+            self.name,
+            p, ir, io, lt, ld, ru,
+            self.annual_revenue_factor, self.max_loan_length()
+        )
+
 
 class ScenarioTester(object):
     def __init__(self, name, scenarios):
         self.name = name
         self.scenarios = scenarios
 
-    def test(self):
+    def test(self, metrics=None, dtype='float64'):
+        # metrics picks which monthly series are kept, the rest are None;
+        # dtype is their storage type, see GridScenarioTester.test.
+        metrics = selected_metrics(metrics)
         interest_rate = self.extract_interest_rates()
-        amount_repayed_by_month = self.calculate_amounts_repayed_by_month()
-        amount_owing_by_month = self.calculate_amounts_owing_by_month()
-        cumulative_revenue = self.calculate_cumulative_revenues_by_month()
-        cumulative_profit = cumulative_revenue - amount_repayed_by_month
-        annual_rates_of_return = self.calculate_annual_rates_of_return()
-
-        results = ScenarioTestResults(
-            self.name,
-            interest_rate,
-            amount_repayed_by_month, amount_owing_by_month,
-            cumulative_revenue, cumulative_profit,
-            annual_rates_of_return,
-            self.labels()
+        series = dict.fromkeys(series_names)
+        if needs_series('amount_repayed', metrics):
+            series['amount_repayed'] = run_stage(
+                'ScenarioTester.amount_repayed',
+                self.calculate_amounts_repayed_by_month
+            )
+        if needs_series('amount_owing', metrics):
+            series['amount_owing'] = run_stage(
+                'ScenarioTester.amount_owing',
+                self.calculate_amounts_owing_by_month
+            )
+        if needs_series('cumulative_revenue', metrics):
+            series['cumulative_revenue'] = run_stage(
+                'ScenarioTester.cumulative_revenue',
+                self.calculate_cumulative_revenues_by_month
+            )
+        if needs_series('cumulative_profit', metrics):
+            series['cumulative_profit'] = run_stage(
+                'ScenarioTester.cumulative_profit',
+                np.subtract,
+                series['cumulative_revenue'], series['amount_repayed']
+            )
+        annual_rates_of_return = run_stage(
+            'ScenarioTester.annual_rates_of_return',
+            self.calculate_annual_rates_of_return
         )
+
+        with stage('ScenarioTester.results'):
+            results = ScenarioTestResults(
+                self.name,
+                interest_rate,
+                *[
+                    series[k].astype(dtype, copy=False)
+                    if k in metrics else None
+                    for k in series_names
+                ],
+                annual_rates_of_return,
+                self.labels()
+            )
         return results
 
     def extract_interest_rates(self):
@@ -192,7 +267,73 @@ class ScenarioTester(object):
         return X
 
     def labels(self):
-        return [s.label() for s in self.scenarios]
+        return ScenarioGrid.from_scenarios(self.name, self.scenarios).labels()
+
+
+class GridScenarioTester(object):
+    def __init__(self, name, grid):
+        self.name = name
+        self.grid = grid
+
+    def test(self, metrics=None, dtype='float64', chunk_size=10000):
+        # metrics is a subset of series_names to keep; the others are left
+        # as None. Series are computed in float64, chunk_size scenarios at
+        # a time, and stored as dtype. Rounding to float32 is exact to a
+        # relative error of 2 ** -24 (6e-8), so a $1m amount is within 6
+        # cents; figures taken as differences of stored months, such as
+        # the monthly profit, carry that error from both months.
+        metrics = selected_metrics(metrics)
+        g = self.grid
+        shape = (g.num_scenarios(), g.max_num_periods() + 1)
+
+        if shape[0] <= chunk_size:
+            computed = self.calculate_series(g, metrics)
+            series = {
+                k: computed[k].astype(dtype, copy=False) for k in metrics
+            }
+        else:
+            series = {k: np.empty(shape, dtype=dtype) for k in metrics}
+            for start in range(0, shape[0], chunk_size):
+                computed = self.calculate_series(
+                    g.chunk(start, start + chunk_size), metrics
+                )
+                for k in metrics:
+                    series[k][start:start + chunk_size] = computed[k]
+
+        with stage('GridScenarioTester.results'):
+            results = ScenarioTestResults(
+                self.name,
+                g.annual_interest_rate,
+                *[series.get(k) for k in series_names],
+                g.calculate_annual_rates_of_return(),
+                g.labels()
+            )
+        return results
+
+    def calculate_series(self, grid, metrics):
+        series = {}
+        if needs_series('amount_repayed', metrics):
+            series['amount_repayed'] = run_stage(
+                'GridScenarioTester.amount_repayed',
+                grid.calculate_amounts_repayed_by_month
+            )
+        if needs_series('amount_owing', metrics):
+            series['amount_owing'] = run_stage(
+                'GridScenarioTester.amount_owing',
+                grid.calculate_amounts_owing_by_month
+            )
+        if needs_series('cumulative_revenue', metrics):
+            series['cumulative_revenue'] = run_stage(
+                'GridScenarioTester.cumulative_revenue',
+                grid.calculate_cumulative_revenues_by_month
+            )
+        if needs_series('cumulative_profit', metrics):
+            series['cumulative_profit'] = run_stage(
+                'GridScenarioTester.cumulative_profit',
+                np.subtract,
+                series['cumulative_revenue'], series['amount_repayed']
+            )
+        return series
 
 
 class ScenarioTestResults(object):
@@ -210,63 +351,367 @@ class ScenarioTestResults(object):
         self.cumulative_revenue = cumulative_revenue
         self.cumulative_profit = cumulative_profit
         self.annual_rates_of_return = annual_rates_of_return
+        if not isinstance(labels, ScenarioLabels):
+            labels = ScenarioLabels.from_dicts(labels)
+        self.labels = labels
+        self._plotter = None
+
+    @property
+    def plotter(self):
+        # matplotlib is only imported once something is plotted, so
+        # compute-only processes never pay for it.
+        if self._plotter is None:
+            from .results_plotter import ResultsPlotter
+            self._plotter = ResultsPlotter(
+                self.name,
+                self.amount_repayed, self.amount_owing,
+                self.cumulative_revenue, self.cumulative_profit,
+                self.labels
+            )
+        return self._plotter
+
+    def summarise(self):
+        self.summary().summarise()
+
+    def summary(self):
+        # Series that were not computed leave their figures, and without
+        # profit the best and worst cases, out of the summary.
+        figures = self.summary_figures()
+        best_label, worst_label = None, None
+        if self.cumulative_profit is not None:
+            best_i, worst_i = self.best_and_worst_index()
+            best_label, worst_label = self.labels[best_i], self.labels[worst_i]
+        return ScenarioSummary(
+            self.name,
+            {k: self.min_max(X) for k, X in figures.items()},
+            best_label, worst_label
+        )
 
-        self.plotter = ResultsPlotter(
+    def summary_figures(self):
+        figures = {'interest_rate': np.asarray(self.interest_rate)}
+        if self.amount_owing is not None:
+            figures['total_cost'] = self.amount_owing[:, 0]
+        if self.amount_repayed is not None:
+            figures['monthly_repayment'] = self.amount_repayed[:, 1]
+        if self.cumulative_revenue is not None:
+            figures['monthly_revenue'] = \
+                self.cumulative_revenue[:, -1] - self.cumulative_revenue[:, -2]
+        if self.cumulative_profit is not None:
+            figures['monthly_profit'] = \
+                self.cumulative_profit[:, -1] - self.cumulative_profit[:, -2]
+            figures['total_profit'] = self.cumulative_profit[:, -1]
+        figures['annual_rate_of_return'] = \
+            np.asarray(self.annual_rates_of_return)
+        return figures
+
+    def computed_series(self):
+        return [k for k in series_names if getattr(self, k) is not None]
+
+    def require_series(self, *names):
+        missing = [k for k in names if getattr(self, k) is None]
+        if missing:
+            raise RuntimeError(
+                'Results for %s were computed without %s.'
+                % (self.name, ', '.join(missing))
+            )
+
+    def best_and_worst_index(self):
+        self.require_series('cumulative_profit')
+        final_profit = self.cumulative_profit[:, -1]
+        return np.argmax(final_profit), np.argmin(final_profit)
+
+    def payback_months(self):
+        self.require_series('cumulative_profit')
+        return first_month(self.cumulative_profit[:, 1:] >= 0, 1)
+
+    def revenue_cover_months(self):
+        self.require_series('cumulative_revenue', 'amount_owing')
+        owing = np.maximum(self.amount_owing, 0)
+        return first_month(self.cumulative_revenue > owing, 0)
+
+    def where(self, **predicates):
+        # Mask of scenarios matching every predicate. Each predicate maps a
+        # label column to a value, a collection of values, or a function
+        # from the column array to a boolean mask.
+        mask = np.ones(len(self.labels), dtype=bool)
+        for k, predicate in predicates.items():
+            column = self.labels.column(k)
+            if callable(predicate):
+                mask &= np.asarray(predicate(column), dtype=bool)
+            elif isinstance(predicate, (list, tuple, set, np.ndarray)):
+                mask &= np.isin(column, list(predicate))
+            else:
+                mask &= column == predicate
+        return mask
+
+    def query(self, **predicates):
+        return self.select(self.where(**predicates))
+
+    def select(self, rows):
+        return ScenarioTestResults(
             self.name,
-            self.amount_repayed, self.amount_owing,
-            self.cumulative_revenue, self.cumulative_profit,
+            np.asarray(self.interest_rate)[rows],
+            *[
+                None if getattr(self, k) is None else getattr(self, k)[rows]
+                for k in series_names
+            ],
+            np.asarray(self.annual_rates_of_return)[rows],
+            self.labels.take(rows)
+        )
+
+    def metrics(self, names):
+        figures = self.summary_figures()
+        values = {}
+        for k in names:
+            if k == 'payback_month':
+                values[k] = never_to_inf(self.payback_months())
+            elif k == 'revenue_cover_month':
+                values[k] = never_to_inf(self.revenue_cover_months())
+            elif k in figures:
+                values[k] = figures[k]
+            else:
+                raise RuntimeError(
+                    'Metric %s is not available for %s.' % (k, self.name)
+                )
+        return values
+
+    def group_summary(self, by,
+                      metrics=('total_profit', 'payback_month'),
+                      percentiles=(5, 50, 95)):
+        # Per-group count, min, max and percentiles of each metric, grouped
+        # by one label column or a list of them. Months that are never
+        # reached count as inf.
+        import pandas as pd
+
+        by = [by] if isinstance(by, str) else list(by)
+        keys = np.stack([self.labels.column(k) for k in by], axis=1)
+        groups, codes = np.unique(keys, axis=0, return_inverse=True)
+        codes = codes.ravel()
+
+        table = {k: groups[:, i] for i, k in enumerate(by)}
+        table['count'] = np.bincount(codes, minlength=len(groups))
+        for k, X in self.metrics(metrics).items():
+            stats = grouped_stats(codes, len(groups), X, percentiles)
+            for stat, values in stats.items():
+                table['%s_%s' % (k, stat)] = values
+        return pd.DataFrame(table)
+
+    def save(self, directory):
+        # One raw .npy block per array and one per label column, so a large
+        # sweep can be reopened with load() as memory maps.
+        os.makedirs(os.path.join(directory, 'labels'), exist_ok=True)
+        labels = self.labels
+
+        series = self.computed_series()
+        for k in series + ['interest_rate', 'annual_rates_of_return']:
+            np.save(os.path.join(directory, k + '.npy'), getattr(self, k))
+        for k, column in labels.columns.items():
+            np.save(os.path.join(directory, 'labels', k + '.npy'), column)
+
+        with open(os.path.join(directory, 'results.json'), 'w') as f:
+            json.dump({
+                'format': results_format_version,
+                'name': self.name,
+                'shape': list(np.shape(getattr(self, series[0]))),
+                'series': series,
+                'labels': list(labels.columns)
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        with open(os.path.join(directory, 'results.json')) as f:
+            manifest = json.load(f)
+        if manifest['format'] != results_format_version:
+            raise RuntimeError(
+                'Unsupported results format %s in %s.'
+                % (manifest['format'], directory)
+            )
+
+        mmap_mode = 'r' if mmap else None
+
+        def load_array(*path):
+            return np.load(os.path.join(directory, *path), mmap_mode=mmap_mode)
+
+        series = manifest.get('series', series_names)
+        arrays = dict.fromkeys(series_names)
+        arrays.update({
+            k: load_array(k + '.npy')
+            for k in series + ['interest_rate', 'annual_rates_of_return']
+        })
+        labels = ScenarioLabels({
+            k: load_array('labels', k + '.npy') for k in manifest['labels']
+        })
+        return cls(
+            manifest['name'],
+            arrays['interest_rate'],
+            arrays['amount_repayed'], arrays['amount_owing'],
+            arrays['cumulative_revenue'], arrays['cumulative_profit'],
+            arrays['annual_rates_of_return'],
             labels
         )
-        pass
 
-    def summarise(self):
-        print(self.name)
-        print(self.summarise_range_of_fractionals(
-            'Interest Rate', self.interest_rate
-        ))
-        print(self.summarise_range_of_dollars(
-            'Total Cost', self.amount_owing[:, 0]
-        ))
-        print(self.summarise_range_of_dollars(
-            'Monthly Repayment', self.amount_repayed[:, 1]
-        ))
-        print(self.summarise_range_of_dollars(
-            'Monthly Revenue',
-            self.cumulative_revenue[:, -1] - self.cumulative_revenue[:, -2]
-        ))
-        print(self.summarise_range_of_dollars(
-            'Monthly Profit',
-            self.cumulative_profit[:, -1] - self.cumulative_profit[:, -2]
-        ))
-        print(self.summarise_range_of_dollars(
-            'Total Profit', self.cumulative_profit[:, -1]
-        ))
-        print(self.summarise_range_of_fractionals(
-            'Annual Rate of Return', self.annual_rates_of_return
-        ))
-
-    def plot(self, file_name):
-        self.plotter.plot_and_savefig(file_name)
+    def plot(self, file_name, mode='lines', bins=256):
+        # mode 'lines' draws every scenario; 'bands' and 'density' draw
+        # per-month statistics, which scale to very large sweeps.
+        if mode == 'lines':
+            self.plotter.plot_and_savefig(file_name)
+        else:
+            from .results_plotter import DensityPlotter
+            summary = self.summary()
+            DensityPlotter(
+                self.name, MonthlyDensity.from_results(self, bins),
+                summary.best_label, summary.worst_label, mode
+            ).plot_and_savefig(file_name)
 
     def summarise_range_of_dollars(self, name, X):
         v_min, v_max = self.min_max(X)
-        if len(X) == 1 or v_min == v_max:
-            return '{0}: ${1:,.0f}'.format(name, X[0])
-        else:
-            return '{0}: ${1:,.0f} - ${2:,.0f}'.format(name, v_min, v_max)
+        return dollar_summary_str(name, v_min, v_max)
 
     def summarise_range_of_fractionals(self, name, X):
         v_min, v_max = self.min_max(X)
-        if len(X) == 1 or v_min == v_max:
-            return '{0}: %{1:,.1f}'.format(name, X[0] * 100)
-        else:
-            return '{0}: %{1:,.1f} - %{2:,.1f}'.format(name, v_min * 100, v_max * 100)
+        return fractional_summary_str(name, v_min, v_max)
 
     def min_max(self, X):
         return np.min(X), np.max(X)
 
-    # def dollar_summary_str(self, name, v_min, v_max):
-    #     return '{0}: ${1:,.0f} - ${2:,.0f}'.format(name, v_min, v_max)
 
-    # def fractional_summary_str(self, name, v_min, v_max):
-    #     return '{0}: %{1:,.1f} - %{2:,.1f}'.format(name, v_min * 100, v_max * 100)
+class ClosedFormSummariser(object):
+    # Summarises a ScenarioCollection (or ScenarioGrid) from closed forms,
+    # in O(n_scenarios) time and O(chunk_size) memory.
+    def __init__(self, name, source, chunk_size=1000000):
+        self.name = name
+        self.source = source
+        self.chunk_size = chunk_size
+
+    def summary(self):
+        ranges = {}
+        best, worst = None, None
+        n = self.source.num_scenarios()
+        for start in range(0, n, self.chunk_size):
+            grid = self.source.chunk(start, start + self.chunk_size)
+            figures = grid.summary_figures()
+            merge_ranges(ranges, value_ranges(figures))
+
+            # Labels are built for the winning rows only, not the chunk.
+            final_profit = figures['total_profit']
+            best_i, worst_i = np.argmax(final_profit), np.argmin(final_profit)
+            if best is None or final_profit[best_i] > best[0]:
+                best = (final_profit[best_i], grid.take([best_i]).labels()[0])
+            if worst is None or final_profit[worst_i] < worst[0]:
+                worst = (
+                    final_profit[worst_i], grid.take([worst_i]).labels()[0]
+                )
+
+        return ScenarioSummary(self.name, ranges, best[1], worst[1])
+
+    def summarise(self):
+        self.summary().summarise()
+
+
+results_format_version = 1
+
+
+summary_formats = [
+    ('interest_rate', 'Interest Rate', 'fractional'),
+    ('total_cost', 'Total Cost', 'dollars'),
+    ('monthly_repayment', 'Monthly Repayment', 'dollars'),
+    ('monthly_revenue', 'Monthly Revenue', 'dollars'),
+    ('monthly_profit', 'Monthly Profit', 'dollars'),
+    ('total_profit', 'Total Profit', 'dollars'),
+    ('annual_rate_of_return', 'Annual Rate of Return', 'fractional')
+]
+
+
+class ScenarioSummary(object):
+    def __init__(self, name, ranges, best_label=None, worst_label=None):
+        self.name = name
+        self.ranges = ranges
+        self.best_label = best_label
+        self.worst_label = worst_label
+
+    def summarise(self):
+        print(self.name)
+        for line in self.summary_lines():
+            print(line)
+
+    def summary_lines(self):
+        lines = []
+        for key, name, kind in summary_formats:
+            if key not in self.ranges:
+                continue
+            v_min, v_max = self.ranges[key]
+            if kind == 'dollars':
+                lines.append(dollar_summary_str(name, v_min, v_max))
+            else:
+                lines.append(fractional_summary_str(name, v_min, v_max))
+        return lines
+
+
+def selected_metrics(metrics):
+    if metrics is None:
+        return list(series_names)
+    if isinstance(metrics, str):
+        metrics = [metrics]
+    if len(metrics) == 0:
+        raise ValueError(
+            'No metrics selected, expected some of %s.' % ', '.join(series_names)
+        )
+    unknown = set(metrics) - set(series_names)
+    if unknown:
+        raise ValueError(
+            'Unknown metrics %s, expected some of %s.'
+            % (sorted(unknown), ', '.join(series_names))
+        )
+    return [k for k in series_names if k in metrics]
+
+
+def needs_series(k, metrics):
+    # Profit is revenue less repayments, so it needs both computed.
+    if k in metrics:
+        return True
+    return 'cumulative_profit' in metrics and \
+        k in ('amount_repayed', 'cumulative_revenue')
+
+
+def never_to_inf(months):
+    return np.where(months < 0, np.inf, months.astype('float64'))
+
+
+def grouped_stats(codes, n_groups, X, percentiles):
+    # Sorting once by (group, value) lets min, max and every percentile be
+    # read off by position, with no loop over groups.
+    order = np.lexsort((X, codes))
+    X = np.asarray(X, dtype='float64')[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    last = starts + counts - 1
+
+    stats = {'min': X[starts], 'max': X[last]}
+    for q in percentiles:
+        position = starts + (counts - 1) * (q / 100)
+        lo = np.floor(position).astype('int64')
+        hi = np.ceil(position).astype('int64')
+        with np.errstate(invalid='ignore'):
+            stats['p%g' % q] = np.where(
+                X[lo] == X[hi], X[lo], X[lo] + (X[hi] - X[lo]) * (position - lo)
+            )
+    return stats
+
+
+def first_month(reached, offset):
+    month = np.argmax(reached, axis=1) + offset
+    return np.where(np.any(reached, axis=1), month, -1)
+
+
+def dollar_summary_str(name, v_min, v_max):
+    if v_min == v_max:
+        return '{0}: ${1:,.0f}'.format(name, v_min)
+    else:
+        return '{0}: ${1:,.0f} - ${2:,.0f}'.format(name, v_min, v_max)
+
+
+def fractional_summary_str(name, v_min, v_max):
+    if v_min == v_max:
+        return '{0}: %{1:,.1f}'.format(name, v_min * 100)
+    else:
+        return '{0}: %{1:,.1f} - %{2:,.1f}'.format(name, v_min * 100, v_max * 100)
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class StreamingHistogram(object):
+    # Fixed-bin histograms for several columns with known bounds. Memory is
+    # columns x bins however many samples are added; percentiles are exact
+    # to within one bin width, (hi - lo) / bins.
+    def __init__(self, lo, hi, bins):
+        self.lo = np.asarray(lo, dtype='float64')
+        self.hi = np.asarray(hi, dtype='float64')
+        self.bins = bins
+        self.counts = np.zeros((len(self.lo), bins), dtype='int64')
+        self.total = np.zeros(len(self.lo))
+        self.min = np.full(len(self.lo), np.inf)
+        self.max = np.full(len(self.lo), -np.inf)
+        self.n = 0
+
+    def add(self, X):
+        width = self.hi - self.lo
+        scale = np.divide(
+            self.bins, width, out=np.zeros_like(width), where=width > 0
+        )
+        i = np.floor((X - self.lo) * scale).astype('int64')
+        i = np.clip(i, 0, self.bins - 1)
+        i += np.arange(X.shape[1]) * self.bins
+
+        self.counts += np.bincount(
+            i.ravel(), minlength=self.counts.size
+        ).reshape(self.counts.shape)
+        self.total += X.sum(axis=0)
+        self.min = np.minimum(self.min, X.min(axis=0))
+        self.max = np.maximum(self.max, X.max(axis=0))
+        self.n += X.shape[0]
+
+    def mean(self):
+        return self.total / self.n
+
+    def percentiles(self, q):
+        # One row per column, one entry per percentile in q, interpolated
+        # linearly within the bin the percentile falls in.
+        q = np.asarray(q, dtype='float64') / 100
+        cumulative = np.cumsum(self.counts, axis=1)
+        target = np.repeat(q[None, :] * self.n, len(self.lo), axis=0)
+
+        rows = np.arange(len(self.lo))[:, None]
+        b = np.array([
+            np.searchsorted(c, t, side='left')
+            for c, t in zip(cumulative, target)
+        ])
+        b = np.minimum(b, self.bins - 1)
+        below = np.where(b > 0, cumulative[rows, np.maximum(b - 1, 0)], 0)
+        in_bin = self.counts[rows, b]
+        fraction = np.divide(
+            target - below, in_bin,
+            out=np.zeros_like(target), where=in_bin > 0
+        )
+
+        width = (self.hi - self.lo)[:, None] / self.bins
+        values = self.lo[:, None] + (b + fraction) * width
+        return np.clip(values, self.min[:, None], self.max[:, None])